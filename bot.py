@@ -4,18 +4,27 @@ import random
 import sqlite3
 import threading
 import unicodedata
-import urllib.error
-import urllib.request
 import math
+import operator
 import statistics
 import asyncio
 import io
+import queue
+import time
 import urllib.parse
+import concurrent.futures
+import functools
+import hashlib
+import heapq
+import bisect
+import string
+from collections import OrderedDict, deque
+from contextlib import contextmanager
 from datetime import datetime, timedelta, timezone
 from dataclasses import dataclass
 from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
-from typing import Dict, List, Optional, Tuple
-from itertools import combinations
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple, Union
+from itertools import combinations, count, islice
 
 import aiohttp
 import discord
@@ -28,6 +37,11 @@ try:
 except ImportError:  # Python < 3.9
     ZoneInfo = None  # type: ignore
 
+try:
+    import orjson  # optionnel : décodage des réponses HenrikDev plus rapide
+except ImportError:
+    orjson = None
+
 # Requis pour la génération d'images style Koya
 try:
     from PIL import Image, ImageDraw, ImageFont
@@ -114,6 +128,29 @@ VALORANT_MAPS = [
 VOTE_THRESHOLD_ACCEPT = 5
 VOTE_THRESHOLD_REJECT = 5
 
+# Équilibrage des équipes : recherche exhaustive sur table jusqu'à BALANCE_TABLE_MAX joueurs,
+# puis branch-and-bound borné dans le temps, amorcé par Karmarkar-Karp + échanges locaux.
+BALANCE_TABLE_MAX = 14
+BALANCE_TIME_BUDGET = float(os.getenv("BALANCE_TIME_BUDGET", "1.0"))
+
+# Taille du lobby PP : minimum pour lancer, et nombre de premiers arrivés répartis (2 à 20).
+PP_MIN_PLAYERS = max(2, min(20, int(os.getenv("PP_MIN_PLAYERS", "10"))))
+PP_MAX_PLAYERS = max(PP_MIN_PLAYERS, min(20, int(os.getenv("PP_MAX_PLAYERS", "10"))))
+
+# Délai minimal (secondes) entre deux éditions du panneau de match d'un même salon.
+MATCH_PANEL_EDIT_INTERVAL = float(os.getenv("MATCH_PANEL_EDIT_INTERVAL", "2.0"))
+
+# Carte de bienvenue : fond local prioritaire, sinon téléchargé une seule fois.
+WELCOME_BG_PATH = os.getenv("WELCOME_BG_PATH", "welcome_bg.png")
+WELCOME_BG_URL = os.getenv(
+    "WELCOME_BG_URL",
+    "https://cdn.discordapp.com/attachments/1460123533828030699/1533549541972902030/a0e0ef14cf5902013f6c12e94e79e45f.png?ex=6a70e4ce&is=6a6f934e&hm=3c2e90efd79c22aff07b073e636d21525ef46595a6d82f2df5bf57d2505527e7&",
+)
+WELCOME_CARD_TIMEOUT = float(os.getenv("WELCOME_CARD_TIMEOUT", "10"))
+# Cache des cartes rendues et des avatars découpés (octets, partagés à parts égales).
+WELCOME_CACHE_BYTES = int(os.getenv("WELCOME_CACHE_BYTES", str(32 * 1024 * 1024)))
+WELCOME_CACHE_DIR = os.getenv("WELCOME_CACHE_DIR", "")  # vide = pas de cache disque
+
 INTENTS = discord.Intents.default()
 INTENTS.guilds = True
 INTENTS.members = True
@@ -200,6 +237,7 @@ def next_join_sequence() -> int:
     JOIN_SEQUENCE += 1
     return JOIN_SEQUENCE
 
+@functools.lru_cache(maxsize=4096)
 def slug(text: str) -> str:
     text = unicodedata.normalize("NFKD", text)
     text = "".join(ch for ch in text if not unicodedata.combining(ch))
@@ -207,13 +245,115 @@ def slug(text: str) -> str:
         text = text.replace(sep, " ")
     return " ".join(text.lower().split())
 
+
+PREP_CHANNEL_SLUGS = frozenset(slug(name) for name in PREP_CHANNEL_NAMES)
+CREATE_VOICE_TRIGGER_SLUGS = frozenset(slug(name) for name in CREATE_VOICE_TRIGGER_ALIASES)
+
+
+# Fournisseurs de métriques exposés sur /metrics (serveur HTTP de santé).
+METRICS_PROVIDERS: Dict[str, Callable[[], dict]] = {}
+
+
+def register_metrics(name: str, provider: Callable[[], dict]) -> None:
+    METRICS_PROVIDERS[name] = provider
+
+
+class ByteLRU:
+    """Cache LRU borné en octets (et non en nombre d'entrées)."""
+
+    def __init__(self, max_bytes: int, sizeof: Callable[[Any], int] = len):
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof
+        self._items: "OrderedDict[Any, Tuple[Any, int]]" = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Any) -> Any:
+        item = self._items.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+        self._items.move_to_end(key)
+        self.hits += 1
+        return item[0]
+
+    def put(self, key: Any, value: Any) -> None:
+        size = self._sizeof(value)
+        if size > self.max_bytes:
+            return
+        old = self._items.pop(key, None)
+        if old is not None:
+            self.bytes -= old[1]
+        self._items[key] = (value, size)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            _, (_, evicted) = self._items.popitem(last=False)
+            self.bytes -= evicted
+            self.evictions += 1
+
+    def pop(self, key: Any) -> None:
+        item = self._items.pop(key, None)
+        if item is not None:
+            self.bytes -= item[1]
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._items),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
 # ===================== DATABASE =====================
 class Database:
     def __init__(self, path: str):
         self.conn = sqlite3.connect(path, check_same_thread=False)
         self.conn.row_factory = sqlite3.Row
+        self.commits = 0
+        self._tx_depth = 0
+        self.configure()
         self.init_schema()
 
+    def configure(self) -> None:
+        """WAL : les lectures ne bloquent plus les écritures et un commit ne fsync que le journal."""
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute("PRAGMA synchronous = NORMAL")
+        self.conn.execute("PRAGMA temp_store = MEMORY")
+        self.conn.execute("PRAGMA cache_size = -8000")
+        self.conn.execute("PRAGMA busy_timeout = 5000")
+
+    def _commit(self) -> None:
+        # Dans une transaction groupée, le commit est fait une seule fois à la sortie.
+        if self._tx_depth == 0:
+            self.conn.commit()
+            self.commits += 1
+
+    @contextmanager
+    def transaction(self):
+        """Regroupe plusieurs écritures dans une seule transaction (un seul commit)."""
+        self._tx_depth += 1
+        try:
+            yield self
+        except BaseException:
+            self._tx_depth -= 1
+            if self._tx_depth == 0:
+                self.conn.rollback()
+            raise
+        self._tx_depth -= 1
+        if self._tx_depth == 0:
+            self.conn.commit()
+            self.commits += 1
+
     def init_schema(self) -> None:
         cur = self.conn.cursor()
         cur.execute(
@@ -263,6 +403,50 @@ class Database:
             """
         )
 
+        # Reprise de l'historique des comptes nouvellement suivis (curseur persistant).
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS rr_backfill (
+                puuid TEXT PRIMARY KEY,
+                stage TEXT NOT NULL DEFAULT 'history',
+                page INTEGER NOT NULL DEFAULT 1,
+                started_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+            """
+        )
+
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS rr_matches (
+                match_id TEXT PRIMARY KEY,
+                payload TEXT NOT NULL,
+                fetched_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+            """
+        )
+
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS api_cache (
+                path TEXT PRIMARY KEY,
+                payload TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+            """
+        )
+
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS panels (
+                channel_id INTEGER NOT NULL,
+                kind TEXT NOT NULL,
+                message_id INTEGER NOT NULL,
+                PRIMARY KEY (channel_id, kind)
+            )
+            """
+        )
+
         # ---------- RR TRACKER ----------
         cur.execute(
             """
@@ -310,7 +494,55 @@ class Database:
             )
             """
         )
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_rr_history_guild_date ON rr_history (guild_id, played_at)")
+        # rr_history.guild_id n'a plus de sens (une partie vaut pour tous les serveurs abonnés,
+        # les stats passent par rr_subscriptions) : toujours 0, et son index est supprimé.
+        if cur.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_rr_history_guild_date'"
+        ).fetchone():
+            cur.execute("DROP INDEX idx_rr_history_guild_date")
+            cur.execute("UPDATE rr_history SET guild_id = 0")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_rr_history_puuid_date ON rr_history (puuid, played_at)")
+
+        # Un compte (rr_players) peut être suivi par plusieurs serveurs : abonnements séparés.
+        has_subscriptions = cur.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'rr_subscriptions'"
+        ).fetchone()
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS rr_subscriptions (
+                guild_id INTEGER NOT NULL,
+                puuid TEXT NOT NULL,
+                discord_id INTEGER,
+                added_by INTEGER,
+                added_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                sort_key INTEGER NOT NULL DEFAULT -1,
+                PRIMARY KEY (guild_id, puuid)
+            )
+            """
+        )
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_rr_subscriptions_puuid ON rr_subscriptions (puuid)")
+        if not has_subscriptions:
+            cur.execute(
+                """
+                INSERT OR IGNORE INTO rr_subscriptions (guild_id, puuid, discord_id, added_by, added_at)
+                SELECT guild_id, puuid, discord_id, added_by, added_at FROM rr_players
+                """
+            )
+        # Clé de classement stockée (Elo effectif), tenue à jour par rr_update_state.
+        subscription_columns = {row[1] for row in cur.execute("PRAGMA table_info(rr_subscriptions)").fetchall()}
+        if "sort_key" not in subscription_columns:
+            cur.execute("ALTER TABLE rr_subscriptions ADD COLUMN sort_key INTEGER NOT NULL DEFAULT -1")
+        if not has_subscriptions or "sort_key" not in subscription_columns:
+            cur.execute(
+                f"""
+                UPDATE rr_subscriptions SET sort_key = COALESCE(
+                    (SELECT {self.RR_SORT_KEY} FROM rr_players p WHERE p.puuid = rr_subscriptions.puuid), -1
+                )
+                """
+            )
+        cur.execute(
+            "CREATE INDEX IF NOT EXISTS idx_rr_subscriptions_rank ON rr_subscriptions (guild_id, sort_key DESC)"
+        )
 
         # Migration douce pour les bases déjà déployées (avant l'ajout du peak rank).
         for ddl in (
@@ -322,7 +554,7 @@ class Database:
             except sqlite3.OperationalError:
                 pass  # la colonne existe déjà
 
-        self.conn.commit()
+        self._commit()
 
     def upsert_player_rank(self, user_id: int, rank_name: str) -> None:
         self.conn.execute(
@@ -333,7 +565,7 @@ class Database:
             """,
             (user_id, rank_name),
         )
-        self.conn.commit()
+        self._commit()
 
     def get_player_rank(self, user_id: int) -> Optional[str]:
         row = self.conn.execute(
@@ -342,12 +574,23 @@ class Database:
         ).fetchone()
         return row[0] if row else None
 
+    def get_player_ranks(self, user_ids: List[int]) -> Dict[int, str]:
+        """Rangs enregistrés de plusieurs joueurs en une seule requête."""
+        if not user_ids:
+            return {}
+        placeholders = ",".join("?" for _ in user_ids)
+        rows = self.conn.execute(
+            f"SELECT user_id, rank_name FROM players WHERE user_id IN ({placeholders})",
+            list(user_ids),
+        ).fetchall()
+        return {int(row[0]): row[1] for row in rows if row[1]}
+
     def register_custom_voice(self, channel_id: int, owner_id: int) -> None:
         self.conn.execute(
             "INSERT OR REPLACE INTO custom_voice_rooms (channel_id, owner_id) VALUES (?, ?)",
             (channel_id, owner_id),
         )
-        self.conn.commit()
+        self._commit()
 
     def get_custom_voice_owner(self, channel_id: int) -> Optional[int]:
         row = self.conn.execute(
@@ -358,7 +601,72 @@ class Database:
 
     def delete_custom_voice(self, channel_id: int) -> None:
         self.conn.execute("DELETE FROM custom_voice_rooms WHERE channel_id = ?", (channel_id,))
-        self.conn.commit()
+        self._commit()
+
+    def list_custom_voices(self) -> Dict[int, int]:
+        rows = self.conn.execute("SELECT channel_id, owner_id FROM custom_voice_rooms").fetchall()
+        return {int(row[0]): int(row[1]) for row in rows}
+
+    def delete_custom_voices(self, channel_ids: List[int]) -> None:
+        self.conn.executemany(
+            "DELETE FROM custom_voice_rooms WHERE channel_id = ?",
+            [(channel_id,) for channel_id in channel_ids],
+        )
+        self._commit()
+
+    def rr_matches_get(self, match_ids: List[str]) -> Dict[str, str]:
+        if not match_ids:
+            return {}
+        placeholders = ",".join("?" for _ in match_ids)
+        rows = self.conn.execute(
+            f"SELECT match_id, payload FROM rr_matches WHERE match_id IN ({placeholders})",
+            list(match_ids),
+        ).fetchall()
+        return {row[0]: row[1] for row in rows}
+
+    def rr_matches_put(self, records: List[Tuple[str, str]]) -> None:
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO rr_matches (match_id, payload) VALUES (?, ?)",
+            records,
+        )
+        self._commit()
+
+    def api_cache_get(self, path: str, now: float) -> Optional[Tuple[str, float]]:
+        row = self.conn.execute(
+            "SELECT payload, expires_at FROM api_cache WHERE path = ? AND expires_at > ?",
+            (path, now),
+        ).fetchone()
+        return (row[0], float(row[1])) if row else None
+
+    def api_cache_put(self, path: str, payload: str, expires_at: float) -> None:
+        self.conn.execute(
+            "INSERT OR REPLACE INTO api_cache (path, payload, expires_at) VALUES (?, ?, ?)",
+            (path, payload, expires_at),
+        )
+        self._commit()
+
+    def api_cache_purge(self, now: float) -> None:
+        self.conn.execute("DELETE FROM api_cache WHERE expires_at <= ?", (now,))
+        self._commit()
+
+    def list_panels(self) -> Dict[Tuple[int, str], int]:
+        rows = self.conn.execute("SELECT channel_id, kind, message_id FROM panels").fetchall()
+        return {(int(row[0]), row[1]): int(row[2]) for row in rows}
+
+    def set_panel(self, channel_id: int, kind: str, message_id: int) -> None:
+        self.conn.execute(
+            "INSERT OR REPLACE INTO panels (channel_id, kind, message_id) VALUES (?, ?, ?)",
+            (channel_id, kind, message_id),
+        )
+        self._commit()
+
+    def delete_panel(self, channel_id: int, kind: str) -> None:
+        self.conn.execute("DELETE FROM panels WHERE channel_id = ? AND kind = ?", (channel_id, kind))
+        self._commit()
+
+    def delete_channel_panels(self, channel_id: int) -> None:
+        self.conn.execute("DELETE FROM panels WHERE channel_id = ?", (channel_id,))
+        self._commit()
 
     def save_active_match(
         self,
@@ -395,7 +703,7 @@ class Database:
                 json.dumps(map_voters),
             ),
         )
-        self.conn.commit()
+        self._commit()
 
     def get_active_match(self, prep_channel_id: int) -> Optional[sqlite3.Row]:
         return self.conn.execute(
@@ -408,9 +716,21 @@ class Database:
             "DELETE FROM active_matches WHERE prep_channel_id = ?",
             (prep_channel_id,),
         )
-        self.conn.commit()
+        self._commit()
 
     # ---------- RR TRACKER ----------
+    # Colonnes d'un compte vu depuis un serveur : le lien Discord vient de l'abonnement.
+    RR_SUBSCRIBED_PLAYERS = """
+        SELECT p.puuid, p.riot_name, p.riot_tag, p.region, p.platform,
+               p.current_tier_id, p.current_tier_name, p.current_rr, p.elo,
+               p.peak_tier_id, p.peak_tier_name, p.last_match_id, p.updated_at,
+               s.guild_id, s.discord_id, s.added_by, s.added_at, s.sort_key
+        FROM rr_subscriptions s
+        JOIN rr_players p ON p.puuid = s.puuid
+    """
+    # Elo effectif : l'elo s'il est connu, sinon tier * 100 + RR ; -1 pour un compte sans rang.
+    RR_SORT_KEY = "COALESCE(CASE WHEN p.elo > 0 THEN p.elo ELSE p.current_tier_id * 100 + p.current_rr END, -1)"
+
     def rr_add_player(self, puuid: str, guild_id: int, discord_id: Optional[int],
                       riot_name: str, riot_tag: str, region: str, platform: str,
                       added_by: int) -> None:
@@ -420,8 +740,6 @@ class Database:
                                     region, platform, added_by)
             VALUES (?, ?, ?, ?, ?, ?, ?, ?)
             ON CONFLICT(puuid) DO UPDATE SET
-                guild_id = excluded.guild_id,
-                discord_id = COALESCE(excluded.discord_id, rr_players.discord_id),
                 riot_name = excluded.riot_name,
                 riot_tag = excluded.riot_tag,
                 region = excluded.region,
@@ -429,62 +747,136 @@ class Database:
             """,
             (puuid, guild_id, discord_id, riot_name, riot_tag, region, platform, added_by),
         )
-        self.conn.commit()
+        self.conn.execute(
+            f"""
+            INSERT INTO rr_subscriptions (guild_id, puuid, discord_id, added_by, sort_key)
+            VALUES (?, ?, ?, ?, (SELECT {self.RR_SORT_KEY} FROM rr_players p WHERE p.puuid = ?))
+            ON CONFLICT(guild_id, puuid) DO UPDATE SET
+                discord_id = COALESCE(excluded.discord_id, rr_subscriptions.discord_id)
+            """,
+            (guild_id, puuid, discord_id, added_by, puuid),
+        )
+        self._commit()
 
     def rr_remove_player(self, puuid: str) -> None:
+        self.conn.execute("DELETE FROM rr_subscriptions WHERE puuid = ?", (puuid,))
         self.conn.execute("DELETE FROM rr_players WHERE puuid = ?", (puuid,))
         self.conn.execute("DELETE FROM rr_history WHERE puuid = ?", (puuid,))
-        self.conn.commit()
+        self.conn.execute("DELETE FROM rr_backfill WHERE puuid = ?", (puuid,))
+        self._commit()
+
+    def rr_unsubscribe(self, guild_id: int, puuid: str) -> bool:
+        """Retire le compte d'un serveur ; renvoie True s'il n'est plus suivi nulle part (supprimé)."""
+        with self.transaction():
+            self.conn.execute(
+                "DELETE FROM rr_subscriptions WHERE guild_id = ? AND puuid = ?", (guild_id, puuid)
+            )
+            remaining = self.conn.execute(
+                "SELECT 1 FROM rr_subscriptions WHERE puuid = ? LIMIT 1", (puuid,)
+            ).fetchone()
+            if remaining is None:
+                self.rr_remove_player(puuid)
+        return remaining is None
 
     def rr_get_player(self, puuid: str) -> Optional[sqlite3.Row]:
         return self.conn.execute("SELECT * FROM rr_players WHERE puuid = ?", (puuid,)).fetchone()
 
-    def rr_find_player(self, guild_id: int, name: str, tag: str) -> Optional[sqlite3.Row]:
+    def rr_tracked_accounts(self) -> List[sqlite3.Row]:
+        """Comptes suivis par au moins un serveur (un seul passage API par compte)."""
         return self.conn.execute(
             """
-            SELECT * FROM rr_players
-            WHERE guild_id = ? AND LOWER(riot_name) = LOWER(?) AND LOWER(riot_tag) = LOWER(?)
+            SELECT * FROM rr_players p
+            WHERE EXISTS (SELECT 1 FROM rr_subscriptions s WHERE s.puuid = p.puuid)
+            """
+        ).fetchall()
+
+    def rr_all_subscriptions(self) -> List[Tuple[int, str, Optional[int]]]:
+        rows = self.conn.execute("SELECT guild_id, puuid, discord_id FROM rr_subscriptions").fetchall()
+        return [(int(row[0]), row[1], row[2]) for row in rows]
+
+    def rr_subscribed_guilds(self, puuid: str) -> List[int]:
+        rows = self.conn.execute("SELECT guild_id FROM rr_subscriptions WHERE puuid = ?", (puuid,)).fetchall()
+        return [int(row[0]) for row in rows]
+
+    def rr_find_player(self, guild_id: int, name: str, tag: str) -> Optional[sqlite3.Row]:
+        return self.conn.execute(
+            self.RR_SUBSCRIBED_PLAYERS + """
+            WHERE s.guild_id = ? AND LOWER(p.riot_name) = LOWER(?) AND LOWER(p.riot_tag) = LOWER(?)
             """,
             (guild_id, name, tag),
         ).fetchone()
 
     def rr_find_by_discord(self, guild_id: int, discord_id: int) -> Optional[sqlite3.Row]:
         return self.conn.execute(
-            "SELECT * FROM rr_players WHERE guild_id = ? AND discord_id = ?",
+            self.RR_SUBSCRIBED_PLAYERS + " WHERE s.guild_id = ? AND s.discord_id = ?",
             (guild_id, discord_id),
         ).fetchone()
 
     def rr_list_players(self, guild_id: int) -> List[sqlite3.Row]:
         return self.conn.execute(
-            "SELECT * FROM rr_players WHERE guild_id = ? ORDER BY riot_name COLLATE NOCASE",
+            self.RR_SUBSCRIBED_PLAYERS + " WHERE s.guild_id = ? ORDER BY p.riot_name COLLATE NOCASE",
             (guild_id,),
         ).fetchall()
 
-    def rr_leaderboard(self, guild_id: int) -> List[sqlite3.Row]:
-        return self.conn.execute(
+    def rr_leaderboard(self, guild_id: int) -> List[Tuple[int, str, str]]:
+        """Classement complet du serveur, (sort_key, riot_name, puuid), lu dans l'ordre de l'index."""
+        return [tuple(row) for row in self.conn.execute(
             """
-            SELECT * FROM rr_players
-            WHERE guild_id = ?
-            ORDER BY (CASE WHEN elo > 0 THEN elo ELSE current_tier_id * 100 + current_rr END) DESC,
-                     riot_name COLLATE NOCASE ASC
+            SELECT s.sort_key, p.riot_name, p.puuid
+            FROM rr_subscriptions s
+            JOIN rr_players p ON p.puuid = s.puuid
+            WHERE s.guild_id = ?
+            ORDER BY s.sort_key DESC, p.riot_name COLLATE NOCASE ASC, p.puuid ASC
             """,
             (guild_id,),
+        ).fetchall()]
+
+    def rr_leaderboard_page(self, guild_id: int, after: Optional[Tuple[int, str, str]],
+                            limit: int) -> List[sqlite3.Row]:
+        """Page suivante du classement par keyset : `after` = (sort_key, riot_name, puuid) de la dernière ligne."""
+        if after is None:
+            return self.conn.execute(
+                self.RR_SUBSCRIBED_PLAYERS + """
+                WHERE s.guild_id = ?
+                ORDER BY s.sort_key DESC, p.riot_name COLLATE NOCASE ASC, p.puuid ASC
+                LIMIT ?
+                """,
+                (guild_id, limit),
+            ).fetchall()
+        sort_key, riot_name, puuid = after
+        return self.conn.execute(
+            self.RR_SUBSCRIBED_PLAYERS + """
+            WHERE s.guild_id = ? AND s.sort_key <= ?
+              AND (s.sort_key < ?
+                   OR p.riot_name COLLATE NOCASE > ?
+                   OR (p.riot_name COLLATE NOCASE = ? AND p.puuid > ?))
+            ORDER BY s.sort_key DESC, p.riot_name COLLATE NOCASE ASC, p.puuid ASC
+            LIMIT ?
+            """,
+            (guild_id, sort_key, sort_key, riot_name, riot_name, puuid, limit),
         ).fetchall()
 
+    def rr_count_players(self, guild_id: int) -> int:
+        return self.conn.execute(
+            "SELECT COUNT(*) FROM rr_subscriptions WHERE guild_id = ?", (guild_id,)
+        ).fetchone()[0]
+
     def rr_update_identity(self, puuid: str, riot_name: str, riot_tag: str) -> None:
         self.conn.execute(
             "UPDATE rr_players SET riot_name = ?, riot_tag = ? WHERE puuid = ?",
             (riot_name, riot_tag, puuid),
         )
-        self.conn.commit()
+        self._commit()
 
-    def rr_link_discord(self, puuid: str, discord_id: Optional[int]) -> None:
+    def rr_link_discord(self, guild_id: int, puuid: str, discord_id: Optional[int]) -> None:
         self.conn.execute(
-            "UPDATE rr_players SET discord_id = ? WHERE puuid = ?", (discord_id, puuid)
+            "UPDATE rr_subscriptions SET discord_id = ? WHERE guild_id = ? AND puuid = ?",
+            (discord_id, guild_id, puuid),
         )
-        self.conn.commit()
+        self._commit()
 
-    def rr_update_state(self, puuid: str, tier_id, tier_name, rr, elo, last_match_id) -> None:
+    def rr_update_state(self, puuid: str, tier_id, tier_name, rr, elo, last_match_id) -> bool:
+        """Met à jour l'état du compte ; renvoie True si sa place dans le classement a pu changer."""
         self.conn.execute(
             """
             UPDATE rr_players
@@ -498,7 +890,16 @@ class Database:
             """,
             (tier_id, tier_name, rr, elo, last_match_id, puuid),
         )
-        self.conn.commit()
+        cur = self.conn.execute(
+            f"""
+            UPDATE rr_subscriptions
+            SET sort_key = (SELECT {self.RR_SORT_KEY} FROM rr_players p WHERE p.puuid = ?)
+            WHERE puuid = ? AND sort_key != (SELECT {self.RR_SORT_KEY} FROM rr_players p WHERE p.puuid = ?)
+            """,
+            (puuid, puuid, puuid),
+        )
+        self._commit()
+        return cur.rowcount > 0
 
     def rr_update_peak(self, puuid: str, tier_id, tier_name) -> None:
         """Met à jour le peak rank uniquement s'il est plus haut que celui déjà enregistré."""
@@ -512,9 +913,9 @@ class Database:
             """,
             (tier_id, tier_name, puuid, tier_id),
         )
-        self.conn.commit()
+        self._commit()
 
-    def rr_add_history(self, puuid: str, guild_id: int, match_id: str, rr_change: int,
+    def rr_add_history(self, puuid: str, match_id: str, rr_change: int,
                        rr_after, tier_name, map_name, agent, kills, deaths, assists,
                        rounds_won, rounds_lost, played_at: str) -> bool:
         """Retourne True si la partie est nouvelle (donc à annoncer)."""
@@ -523,14 +924,78 @@ class Database:
             INSERT OR IGNORE INTO rr_history (
                 puuid, guild_id, match_id, rr_change, rr_after, tier_name, map_name,
                 agent, kills, deaths, assists, rounds_won, rounds_lost, played_at
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ) VALUES (?, 0, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             """,
-            (puuid, guild_id, match_id, rr_change, rr_after, tier_name, map_name,
+            (puuid, match_id, rr_change, rr_after, tier_name, map_name,
              agent, kills, deaths, assists, rounds_won, rounds_lost, played_at),
         )
-        self.conn.commit()
+        self._commit()
         return cur.rowcount > 0
 
+    def rr_backfill_start(self, puuid: str) -> None:
+        self.conn.execute("INSERT OR IGNORE INTO rr_backfill (puuid) VALUES (?)", (puuid,))
+        self._commit()
+
+    def rr_backfill_pending(self) -> List[sqlite3.Row]:
+        return self.conn.execute(
+            """
+            SELECT b.puuid, b.stage, b.page, b.started_at, p.region, p.platform, p.riot_name,
+                   (SELECT MIN(s.guild_id) FROM rr_subscriptions s WHERE s.puuid = b.puuid) AS guild_id
+            FROM rr_backfill b
+            JOIN rr_players p ON p.puuid = b.puuid
+            WHERE b.stage != 'done'
+            ORDER BY b.updated_at
+            """
+        ).fetchall()
+
+    def rr_backfill_history(self, puuid: str, rows: List[tuple], stage: str, page: int) -> int:
+        """Insère une page d'historique et avance le curseur dans la même transaction."""
+        with self.transaction():
+            cur = self.conn.executemany(
+                """
+                INSERT OR IGNORE INTO rr_history (
+                    puuid, guild_id, match_id, rr_change, rr_after, tier_name, map_name, played_at
+                ) VALUES (?, 0, ?, ?, ?, ?, ?, ?)
+                """,
+                rows,
+            )
+            self._backfill_advance(puuid, stage, page)
+        return cur.rowcount
+
+    def rr_backfill_details(self, puuid: str, rows: List[tuple], stage: str, page: int) -> int:
+        """Complète agent/KDA/score des parties reprises, curseur avancé dans la même transaction."""
+        with self.transaction():
+            cur = self.conn.executemany(
+                """
+                UPDATE rr_history
+                SET map_name = COALESCE(map_name, ?), agent = COALESCE(agent, ?),
+                    kills = COALESCE(kills, ?), deaths = COALESCE(deaths, ?),
+                    assists = COALESCE(assists, ?), rounds_won = COALESCE(rounds_won, ?),
+                    rounds_lost = COALESCE(rounds_lost, ?)
+                WHERE puuid = ? AND match_id = ?
+                """,
+                rows,
+            )
+            self._backfill_advance(puuid, stage, page)
+        return cur.rowcount
+
+    def _backfill_advance(self, puuid: str, stage: str, page: int) -> None:
+        self.conn.execute(
+            "UPDATE rr_backfill SET stage = ?, page = ?, updated_at = CURRENT_TIMESTAMP WHERE puuid = ?",
+            (stage, page, puuid),
+        )
+        self._commit()
+
+    def rr_last_played(self, puuids: List[str]) -> Dict[str, str]:
+        if not puuids:
+            return {}
+        placeholders = ",".join("?" for _ in puuids)
+        rows = self.conn.execute(
+            f"SELECT puuid, MAX(played_at) FROM rr_history WHERE puuid IN ({placeholders}) GROUP BY puuid",
+            list(puuids),
+        ).fetchall()
+        return {row[0]: row[1] for row in rows if row[1]}
+
     def rr_player_history(self, puuid: str, limit: int = 10) -> List[sqlite3.Row]:
         return self.conn.execute(
             "SELECT * FROM rr_history WHERE puuid = ? ORDER BY played_at DESC LIMIT ?",
@@ -547,8 +1012,9 @@ class Database:
                    SUM(CASE WHEN h.rr_change > 0 THEN 1 ELSE 0 END) AS wins,
                    SUM(CASE WHEN h.rr_change < 0 THEN 1 ELSE 0 END) AS losses
             FROM rr_history h
+            JOIN rr_subscriptions s ON s.puuid = h.puuid AND s.guild_id = ?
             JOIN rr_players p ON p.puuid = h.puuid
-            WHERE h.guild_id = ? AND h.played_at >= ?
+            WHERE h.played_at >= ?
             GROUP BY h.puuid
             ORDER BY total DESC
             """,
@@ -559,18 +1025,161 @@ class Database:
     def rr_period_stats(self, guild_id: int, puuid: str, since_iso: str) -> Optional[sqlite3.Row]:
         return self.conn.execute(
             """
-            SELECT SUM(rr_change) AS total,
+            SELECT SUM(h.rr_change) AS total,
                    COUNT(*) AS games,
-                   SUM(CASE WHEN rr_change > 0 THEN 1 ELSE 0 END) AS wins,
-                   SUM(CASE WHEN rr_change < 0 THEN 1 ELSE 0 END) AS losses
-            FROM rr_history
-            WHERE guild_id = ? AND puuid = ? AND played_at >= ?
+                   SUM(CASE WHEN h.rr_change > 0 THEN 1 ELSE 0 END) AS wins,
+                   SUM(CASE WHEN h.rr_change < 0 THEN 1 ELSE 0 END) AS losses
+            FROM rr_history h
+            JOIN rr_subscriptions s ON s.puuid = h.puuid AND s.guild_id = ?
+            WHERE h.puuid = ? AND h.played_at >= ?
             """,
             (guild_id, puuid, since_iso),
         ).fetchone()
 
 
-db = Database(DB_PATH)
+class AsyncDatabase:
+    """Accès asynchrone à `Database` via un thread SQLite dédié.
+
+    Le thread possède la connexion et consomme une file de requêtes : la boucle
+    asyncio ne bloque jamais sur le disque. Chaque méthode publique de `Database`
+    est disponible en version awaitable (`await db.get_player_rank(...)`), et
+    `run()` exécute une fonction quelconque sur la connexion du thread.
+    """
+
+    def __init__(self, path: str):
+        self._requests: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._ready = threading.Event()
+        self._startup_error: Optional[BaseException] = None
+        self._sync: Optional[Database] = None
+        self._stats_lock = threading.Lock()
+        # nom -> [appels, attente cumulée (s), exécution cumulée (s), exécution max (s)]
+        self._latency: Dict[str, List[float]] = {}
+        self._thread = threading.Thread(target=self._worker, args=(path,), name="sqlite-writer", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        if self._startup_error is not None:
+            raise self._startup_error
+
+    def _worker(self, path: str) -> None:
+        try:
+            self._sync = Database(path)
+        except BaseException as exc:
+            self._startup_error = exc
+            self._ready.set()
+            return
+        self._ready.set()
+
+        while True:
+            item = self._requests.get()
+            if item is None:
+                break
+            future, name, fn, args, kwargs, queued_at = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            started = time.perf_counter()
+            try:
+                result = fn(self._sync, *args, **kwargs)
+            except BaseException as exc:
+                future.set_exception(exc)
+            else:
+                future.set_result(result)
+            self._record(name, started - queued_at, time.perf_counter() - started)
+        self._sync.conn.close()
+
+    def _record(self, name: str, waited: float, elapsed: float) -> None:
+        with self._stats_lock:
+            entry = self._latency.setdefault(name, [0, 0.0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += waited
+            entry[2] += elapsed
+            entry[3] = max(entry[3], elapsed)
+
+    def submit(self, name: str, fn: Callable[..., Any], *args, **kwargs) -> "concurrent.futures.Future":
+        future: concurrent.futures.Future = concurrent.futures.Future()
+        self._requests.put((future, name, fn, args, kwargs, time.perf_counter()))
+        return future
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Exécute `fn(database, *args, **kwargs)` dans le thread SQLite."""
+        name = getattr(fn, "__name__", "run")
+        return await asyncio.wrap_future(self.submit(name, fn, *args, **kwargs))
+
+    def __getattr__(self, name: str):
+        method = getattr(Database, name, None)
+        if name.startswith("_") or not callable(method):
+            raise AttributeError(name)
+
+        async def call(*args, **kwargs):
+            return await asyncio.wrap_future(self.submit(name, method, *args, **kwargs))
+
+        call.__name__ = name
+        return call
+
+    def unit_of_work(self) -> "UnitOfWork":
+        return UnitOfWork(self)
+
+    def stats(self) -> dict:
+        """Latence par méthode (attente dans la file et exécution SQLite, en ms) et nombre de commits."""
+        with self._stats_lock:
+            snapshot = {name: list(values) for name, values in self._latency.items()}
+        return {
+            "commits": self._sync.commits if self._sync is not None else 0,
+            "queries": {
+                name: {
+                    "calls": int(calls),
+                    "avg_wait_ms": round(waited * 1000 / calls, 3),
+                    "avg_ms": round(elapsed * 1000 / calls, 3),
+                    "max_ms": round(worst * 1000, 3),
+                }
+                for name, (calls, waited, elapsed, worst) in snapshot.items()
+            },
+        }
+
+    def close(self) -> None:
+        self._requests.put(None)
+        self._thread.join(timeout=5)
+
+
+def _apply_unit_of_work(database: Database, operations: List[Tuple[str, tuple, dict]]) -> List[Any]:
+    with database.transaction():
+        return [getattr(database, name)(*args, **kwargs) for name, args, kwargs in operations]
+
+
+class UnitOfWork:
+    """Écritures différées, appliquées ensemble dans une seule transaction.
+
+    `uow.rr_update_state(...)` enregistre l'appel et renvoie son index ;
+    `await uow.commit()` exécute tout en un seul commit et renvoie les résultats
+    dans l'ordre des appels.
+    """
+
+    def __init__(self, database: AsyncDatabase):
+        self._database = database
+        self._operations: List[Tuple[str, tuple, dict]] = []
+
+    def __getattr__(self, name: str):
+        method = getattr(Database, name, None)
+        if name.startswith("_") or not callable(method):
+            raise AttributeError(name)
+
+        def stage(*args, **kwargs) -> int:
+            self._operations.append((name, args, kwargs))
+            return len(self._operations) - 1
+
+        return stage
+
+    def __len__(self) -> int:
+        return len(self._operations)
+
+    async def commit(self) -> List[Any]:
+        if not self._operations:
+            return []
+        operations, self._operations = self._operations, []
+        return await self._database.run(_apply_unit_of_work, operations)
+
+
+db = AsyncDatabase(DB_PATH)
+register_metrics("database", db.stats)
 
 
 @dataclass
@@ -606,55 +1215,171 @@ class MatchState:
 
 
 # ===================== IMAGE GENERATION =====================
-async def generate_welcome_card(member: discord.Member) -> io.BytesIO:
-    # 1. Base Background (Image Demandée)
-    bg_url = "https://cdn.discordapp.com/attachments/1460123533828030699/1533549541972902030/a0e0ef14cf5902013f6c12e94e79e45f.png?ex=6a70e4ce&is=6a6f934e&hm=3c2e90efd79c22aff07b073e636d21525ef46595a6d82f2df5bf57d2505527e7&"
-    try:
-        req = urllib.request.Request(bg_url, headers={'User-Agent': 'Mozilla/5.0'})
-        with urllib.request.urlopen(req) as response:
-            bg_bytes = response.read()
-        bg = Image.open(io.BytesIO(bg_bytes)).convert("RGBA")
-        bg = bg.resize((800, 400)) # Format bannière large
-    except Exception:
-        # Fallback si l'image ne charge pas
-        bg = Image.new("RGBA", (800, 400), (20, 22, 28, 255))
-        
-    # 2. Avatar Processing (Image très grande, parfaitement centrée)
-    avatar_size = 300 # Très grande taille
-    avatar_bytes = await member.display_avatar.replace(size=512, format="png").read()
-    avatar = Image.open(io.BytesIO(avatar_bytes)).convert("RGBA")
-    avatar = avatar.resize((avatar_size, avatar_size))
+WELCOME_CARD_SIZE = (800, 400)  # Format bannière large
+WELCOME_AVATAR_SIZE = 300  # Très grande taille
+WELCOME_BORDER_SIZE = WELCOME_AVATAR_SIZE + 16  # Contour rouge, +16px plus grand que l'avatar
+WELCOME_BG_RETRY = 600.0
 
-    # Masque circulaire
-    mask = Image.new("L", (avatar_size, avatar_size), 0)
-    mask_draw = ImageDraw.Draw(mask)
-    mask_draw.ellipse((0, 0, avatar_size, avatar_size), fill=255)
-    
-    circular_avatar = Image.new("RGBA", (avatar_size, avatar_size))
+
+@functools.lru_cache(maxsize=1)
+def _welcome_overlays() -> Tuple["Image.Image", "Image.Image"]:
+    """Masque circulaire de l'avatar et contour rouge, calculés une seule fois."""
+    mask = Image.new("L", (WELCOME_AVATAR_SIZE, WELCOME_AVATAR_SIZE), 0)
+    ImageDraw.Draw(mask).ellipse((0, 0, WELCOME_AVATAR_SIZE, WELCOME_AVATAR_SIZE), fill=255)
+    border = Image.new("RGBA", (WELCOME_BORDER_SIZE, WELCOME_BORDER_SIZE), (0, 0, 0, 0))
+    ImageDraw.Draw(border).ellipse((0, 0, WELCOME_BORDER_SIZE, WELCOME_BORDER_SIZE), fill=(231, 76, 60, 255))
+    return mask, border
+
+
+def _decode_welcome_background(data: bytes) -> Tuple["Image.Image", str]:
+    """Fond prêt à composer et empreinte de ses pixels (clé des cartes en cache)."""
+    background = Image.open(io.BytesIO(data)).convert("RGBA").resize(WELCOME_CARD_SIZE)
+    return background, hashlib.sha1(background.tobytes()).hexdigest()[:16]
+
+
+def _circular_avatar(avatar_bytes: bytes) -> "Image.Image":
+    mask, _ = _welcome_overlays()
+    avatar = Image.open(io.BytesIO(avatar_bytes)).convert("RGBA")
+    avatar = avatar.resize((WELCOME_AVATAR_SIZE, WELCOME_AVATAR_SIZE))
+    circular_avatar = Image.new("RGBA", (WELCOME_AVATAR_SIZE, WELCOME_AVATAR_SIZE))
     circular_avatar.paste(avatar, (0, 0), mask)
+    return circular_avatar
 
-    # Création du contour (Border rouge, +16px plus grand que l'avatar)
-    border_size = avatar_size + 16
-    border_mask = Image.new("RGBA", (border_size, border_size), (0, 0, 0, 0))
-    border_draw = ImageDraw.Draw(border_mask)
-    border_draw.ellipse((0, 0, border_size, border_size), fill=(231, 76, 60, 255))
-    
-    # Centrage parfait sur le canvas de 800x400
-    avatar_x = (800 - avatar_size) // 2
-    avatar_y = (400 - avatar_size) // 2
-    
-    border_x = (800 - border_size) // 2
-    border_y = (400 - border_size) // 2
-    
-    # Collage sur le fond
-    bg.paste(border_mask, (border_x, border_y), border_mask)
-    bg.paste(circular_avatar, (avatar_x, avatar_y), circular_avatar)
 
-    # Sauvegarde
+def _compose_welcome_card(background: "Image.Image", circular_avatar: "Image.Image") -> bytes:
+    """Composition et encodage PNG (exécuté hors de la boucle asyncio)."""
+    _, border = _welcome_overlays()
+    # Centrage parfait sur le canvas
+    width, height = WELCOME_CARD_SIZE
+    card = background.copy()
+    card.paste(border, ((width - WELCOME_BORDER_SIZE) // 2, (height - WELCOME_BORDER_SIZE) // 2), border)
+    card.paste(circular_avatar, ((width - WELCOME_AVATAR_SIZE) // 2, (height - WELCOME_AVATAR_SIZE) // 2), circular_avatar)
+
     buffer = io.BytesIO()
-    bg.convert("RGB").save(buffer, format="PNG")
-    buffer.seek(0)
-    return buffer
+    card.convert("RGB").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _image_nbytes(image: "Image.Image") -> int:
+    return image.width * image.height * len(image.getbands())
+
+
+def _read_cached_card(path: str) -> Optional[bytes]:
+    try:
+        with open(path, "rb") as handle:
+            return handle.read()
+    except OSError:
+        return None
+
+
+def _write_cached_card(path: str, data: bytes) -> None:
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as handle:
+            handle.write(data)
+        os.replace(tmp_path, path)
+    except OSError as exc:
+        print(f"[HTTP] Cache disque des cartes indisponible : {exc}")
+
+
+class WelcomeCardRenderer:
+    """Fond décodé et redimensionné gardé en mémoire ; composition dans un pool de threads.
+
+    Les cartes rendues et les avatars découpés sont mis en cache par clé d'avatar
+    (hash Discord) : un retour ou un avatar par défaut déjà vu ne coûte ni réseau
+    ni décodage ni encodage. La clé d'une carte inclut l'empreinte du fond, si bien
+    qu'un nouveau WELCOME_BG_URL / WELCOME_BG_PATH n'est jamais servi avec l'ancien.
+    """
+
+    def __init__(self):
+        self._background: Optional["Image.Image"] = None
+        self._background_key = ""
+        self._retry_at = 0.0
+        self._lock: Optional[asyncio.Lock] = None
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=2, thread_name_prefix="welcome-card")
+        self.cards = ByteLRU(WELCOME_CACHE_BYTES // 2)
+        self.avatars = ByteLRU(WELCOME_CACHE_BYTES // 2, sizeof=_image_nbytes)
+        self.disk_hits = 0
+
+    async def _load_background(self) -> Tuple["Image.Image", str]:
+        loop = asyncio.get_running_loop()
+        if WELCOME_BG_PATH and os.path.isfile(WELCOME_BG_PATH):
+            with open(WELCOME_BG_PATH, "rb") as handle:
+                data = handle.read()
+        else:
+            timeout = aiohttp.ClientTimeout(total=WELCOME_CARD_TIMEOUT)
+            async with aiohttp.ClientSession(timeout=timeout, headers={"User-Agent": "Mozilla/5.0"}) as session:
+                async with session.get(WELCOME_BG_URL) as response:
+                    response.raise_for_status()
+                    data = await response.read()
+        return await loop.run_in_executor(self._pool, _decode_welcome_background, data)
+
+    async def background(self) -> Optional["Image.Image"]:
+        """Fond en cache, ou None s'il est indisponible pour le moment."""
+        if self._background is not None:
+            return self._background
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._background is None and time.monotonic() >= self._retry_at:
+                try:
+                    self._background, self._background_key = await self._load_background()
+                except Exception as exc:
+                    # Nouvel essai plus tard ; en attendant, fond uni.
+                    self._retry_at = time.monotonic() + WELCOME_BG_RETRY
+                    print(f"[HTTP] Fond de bienvenue indisponible : {exc}")
+        return self._background
+
+    async def _circular_avatar(self, asset: discord.Asset) -> "Image.Image":
+        circular = self.avatars.get(asset.key)
+        if circular is None:
+            avatar_bytes = await asset.replace(size=512, format="png").read()
+            loop = asyncio.get_running_loop()
+            circular = await loop.run_in_executor(self._pool, _circular_avatar, avatar_bytes)
+            self.avatars.put(asset.key, circular)
+        return circular
+
+    async def _render(self, asset: discord.Asset) -> bytes:
+        loop = asyncio.get_running_loop()
+        background = await self.background()
+        if background is None:
+            # Fond de secours : la carte n'est pas mise en cache.
+            fallback = Image.new("RGBA", WELCOME_CARD_SIZE, (20, 22, 28, 255))
+            return await loop.run_in_executor(self._pool, _compose_welcome_card, fallback, await self._circular_avatar(asset))
+
+        key = f"{self._background_key}-{asset.key}"
+        card = self.cards.get(key)
+        if card is not None:
+            return card
+        disk_path = os.path.join(WELCOME_CACHE_DIR, f"{key}.png") if WELCOME_CACHE_DIR else None
+        if disk_path is not None:
+            card = await loop.run_in_executor(self._pool, _read_cached_card, disk_path)
+            if card is not None:
+                self.disk_hits += 1
+                self.cards.put(key, card)
+                return card
+
+        card = await loop.run_in_executor(self._pool, _compose_welcome_card, background, await self._circular_avatar(asset))
+        self.cards.put(key, card)
+        if disk_path is not None:
+            loop.run_in_executor(self._pool, _write_cached_card, disk_path, card)
+        return card
+
+    async def render(self, member: discord.Member) -> io.BytesIO:
+        card = await asyncio.wait_for(self._render(member.display_avatar), timeout=WELCOME_CARD_TIMEOUT)
+        return io.BytesIO(card)
+
+    def stats(self) -> dict:
+        return {"cards": self.cards.stats(), "avatars": self.avatars.stats(), "disk_hits": self.disk_hits}
+
+
+welcome_cards = WelcomeCardRenderer()
+register_metrics("welcome_cards", welcome_cards.stats)
+
+
+async def generate_welcome_card(member: discord.Member) -> io.BytesIO:
+    return await welcome_cards.render(member)
 
 
 # ===================== HELPERS =====================
@@ -673,9 +1398,10 @@ def rank_select_emoji(guild: Optional[discord.Guild], rank_name: str):
     return tier_emoji(rank_name)
 
 
-def find_rank_role_name(role: discord.Role) -> Optional[str]:
-    """Retourne le nom de rang correspondant à un rôle, même s'il est décoré."""
-    role_slug = slug(role.name)
+@functools.lru_cache(maxsize=2048)
+def rank_name_for_label(label: str) -> Optional[str]:
+    """Rang correspondant à un nom de rôle, même décoré (mémorisé par nom)."""
+    role_slug = slug(label)
     best = None
     for rank_name, _ in RANK_OPTIONS:
         rank_slug = slug(rank_name)
@@ -686,8 +1412,13 @@ def find_rank_role_name(role: discord.Role) -> Optional[str]:
     return best
 
 
-def rank_value_for_member(member: discord.Member) -> int:
-    stored = db.get_player_rank(member.id)
+def find_rank_role_name(role: discord.Role) -> Optional[str]:
+    """Retourne le nom de rang correspondant à un rôle, même s'il est décoré."""
+    return rank_name_for_label(role.name)
+
+
+def rank_value_for_member(member: discord.Member, stored: Optional[str] = None) -> int:
+    """`stored` est le rang enregistré en base (voir `fetch_stored_ranks`)."""
     best = 0
     if stored and stored in RANK_VALUE_BY_NAME:
         best = RANK_VALUE_BY_NAME[stored]
@@ -697,24 +1428,128 @@ def rank_value_for_member(member: discord.Member) -> int:
     return best
 
 
+async def fetch_stored_ranks(members: List[discord.Member]) -> Dict[int, str]:
+    return await db.get_player_ranks([member.id for member in members])
+
+
+def _team_channel_pair(voices: List[discord.VoiceChannel], prep_index: int, prep_ids: Set[int]) -> Tuple[Optional[int], Optional[int]]:
+    """Salons attaque/défense placés sous un salon de préparation (jusqu'au suivant)."""
+    attack = None
+    defense = None
+    for vc in voices[prep_index + 1:]:
+        if vc.id in prep_ids:
+            break
+        name = slug(vc.name)
+        if "attaque" in name or "atk" in name or name.endswith("att"):
+            attack = vc.id
+        if "defense" in name or "def" in name:
+            defense = vc.id
+    return attack, defense
+
+
+class _GuildChannels:
+    """Classement des salons d'un serveur, reconstruit à chaque événement de salon."""
+
+    __slots__ = ("categories", "texts", "text_order", "voices", "prep_ids", "trigger_ids", "team_pairs")
+
+    def __init__(self, guild: discord.Guild):
+        self.categories: Dict[str, int] = {}
+        for category in guild.categories:
+            self.categories.setdefault(slug(category.name), category.id)
+
+        # Salons textuels par nom simplifié, dans l'ordre d'affichage du serveur.
+        self.texts: Dict[str, List[discord.TextChannel]] = {}
+        self.text_order: Dict[int, int] = {}
+        for order, channel in enumerate(guild.text_channels):
+            self.texts.setdefault(slug(channel.name), []).append(channel)
+            self.text_order[channel.id] = order
+
+        self.voices: Dict[str, int] = {}
+        self.prep_ids: Set[int] = set()
+        self.trigger_ids: Set[int] = set()
+        for channel in guild.channels:
+            if not isinstance(channel, discord.VoiceChannel):
+                continue
+            name = slug(channel.name)
+            self.voices.setdefault(name, channel.id)
+            if name in PREP_CHANNEL_SLUGS:
+                self.prep_ids.add(channel.id)
+            if name in CREATE_VOICE_TRIGGER_SLUGS:
+                self.trigger_ids.add(channel.id)
+
+        self.team_pairs: Dict[int, Tuple[Optional[int], Optional[int]]] = {}
+        for category in guild.categories:
+            voices = sorted(category.voice_channels, key=lambda c: c.position)
+            for index, vc in enumerate(voices):
+                if vc.id in self.prep_ids:
+                    self.team_pairs[vc.id] = _team_channel_pair(voices, index, self.prep_ids)
+
+
+class ChannelIndex:
+    """Index des salons par serveur : les recherches par nom deviennent des accès dict."""
+
+    def __init__(self):
+        self._guilds: Dict[int, _GuildChannels] = {}
+
+    def invalidate(self, guild_id: int) -> None:
+        self._guilds.pop(guild_id, None)
+
+    def of(self, guild: discord.Guild) -> _GuildChannels:
+        entry = self._guilds.get(guild.id)
+        if entry is None:
+            entry = self._guilds[guild.id] = _GuildChannels(guild)
+        return entry
+
+    def _channel(self, guild: discord.Guild, channel_id: Optional[int]) -> Optional[discord.abc.GuildChannel]:
+        if channel_id is None:
+            return None
+        channel = guild.get_channel(channel_id)
+        if channel is None:  # événement manqué : l'index sera reconstruit au prochain accès
+            self.invalidate(guild.id)
+        return channel
+
+    def category(self, guild: discord.Guild, name: str) -> Optional[discord.CategoryChannel]:
+        return self._channel(guild, self.of(guild).categories.get(slug(name)))
+
+    def text_channel(self, guild: discord.Guild, aliases: List[str], category: Optional[discord.CategoryChannel]) -> Optional[discord.TextChannel]:
+        entry = self.of(guild)
+        best = None
+        for name in aliases:
+            if not name:
+                continue
+            for channel in entry.texts.get(slug(name), ()):
+                if category is not None and channel.category_id != category.id:
+                    continue
+                if best is None or entry.text_order[channel.id] < entry.text_order[best.id]:
+                    best = channel
+                break
+        return best
+
+    def voice(self, guild: discord.Guild, name: str) -> Optional[discord.VoiceChannel]:
+        return self._channel(guild, self.of(guild).voices.get(slug(name)))
+
+    def team_channels(self, prep_channel: discord.VoiceChannel) -> Tuple[Optional[discord.VoiceChannel], Optional[discord.VoiceChannel]]:
+        attack_id, defense_id = self.of(prep_channel.guild).team_pairs.get(prep_channel.id, (None, None))
+        return self._channel(prep_channel.guild, attack_id), self._channel(prep_channel.guild, defense_id)
+
+
+channel_index = ChannelIndex()
+
+
 def is_prep_voice(channel: Optional[discord.abc.GuildChannel]) -> bool:
-    return isinstance(channel, discord.VoiceChannel) and slug(channel.name) in {slug(n) for n in PREP_CHANNEL_NAMES}
+    return isinstance(channel, discord.VoiceChannel) and channel.id in channel_index.of(channel.guild).prep_ids
 
 
 def find_category(guild: discord.Guild, name: str) -> Optional[discord.CategoryChannel]:
-    return discord.utils.find(
-        lambda c: isinstance(c, discord.CategoryChannel) and slug(c.name) == slug(name),
-        guild.categories,
-    )
+    return channel_index.category(guild, name)
 
 
 def find_text_channel(guild: discord.Guild, aliases: List[str], *, category: Optional[discord.CategoryChannel] = None) -> Optional[discord.TextChannel]:
-    wanted = {slug(name) for name in aliases if name}
-    channels = category.text_channels if category is not None else guild.text_channels
-    return discord.utils.find(
-        lambda c: isinstance(c, discord.TextChannel) and slug(c.name) in wanted,
-        channels,
-    )
+    return channel_index.text_channel(guild, aliases, category)
+
+
+def find_prep_voice(guild: discord.Guild, name: str) -> Optional[discord.VoiceChannel]:
+    return channel_index.voice(guild, name)
 
 
 def get_verify_channel(guild: discord.Guild) -> Optional[discord.TextChannel]:
@@ -745,17 +1580,145 @@ def is_verified_member(member: discord.Member) -> bool:
     return any(r.name == PLAYER_ROLE for r in member.roles) or has_orga_access(member)
 
 
+class CustomVoiceRegistry:
+    """Propriétaires des vocs privées gardés en mémoire (écriture immédiate en base).
+
+    Chargé au démarrage depuis `custom_voice_rooms` : le chemin chaud des
+    événements vocaux ne touche plus SQLite.
+    """
+
+    def __init__(self):
+        self._owners: Dict[int, int] = {}
+
+    async def load(self) -> None:
+        self._owners = await db.list_custom_voices()
+
+    def owner(self, channel_id: int) -> Optional[int]:
+        return self._owners.get(channel_id)
+
+    def __contains__(self, channel_id: int) -> bool:
+        return channel_id in self._owners
+
+    async def register(self, channel_id: int, owner_id: int) -> None:
+        self._owners[channel_id] = owner_id
+        await db.register_custom_voice(channel_id, owner_id)
+
+    async def remove(self, channel_id: int) -> None:
+        if self._owners.pop(channel_id, None) is not None:
+            await db.delete_custom_voice(channel_id)
+
+    async def reconcile(self, client: discord.Client) -> int:
+        """Supprime en une fois les salons enregistrés qui n'existent plus."""
+        if any(guild.unavailable for guild in client.guilds):
+            return 0  # cache incomplet : on ne supprime rien
+        orphans = [channel_id for channel_id in self._owners if client.get_channel(channel_id) is None]
+        if orphans:
+            for channel_id in orphans:
+                del self._owners[channel_id]
+            await db.delete_custom_voices(orphans)
+        return len(orphans)
+
+
+custom_voices = CustomVoiceRegistry()
+
+
+class PanelRegistry:
+    """Messages de panneau du bot par (salon, type), en mémoire et dans la table `panels`."""
+
+    def __init__(self):
+        self._messages: Dict[Tuple[int, str], int] = {}
+        self._scanned: Set[Tuple[int, str]] = set()
+
+    async def load(self) -> None:
+        self._messages = await db.list_panels()
+
+    def get(self, channel_id: int, kind: str) -> Optional[int]:
+        return self._messages.get((channel_id, kind))
+
+    async def set(self, channel_id: int, kind: str, message_id: int) -> None:
+        self._messages[(channel_id, kind)] = message_id
+        await db.set_panel(channel_id, kind, message_id)
+
+    async def forget(self, channel_id: int, kind: str) -> None:
+        if self._messages.pop((channel_id, kind), None) is not None:
+            await db.delete_panel(channel_id, kind)
+
+    def mark_empty(self, channel_id: int, kind: str) -> None:
+        """Salon tout juste créé par le bot : aucun ancien panneau à chercher dans l'historique."""
+        self._scanned.add((channel_id, kind))
+
+    async def forget_channel(self, channel_id: int) -> None:
+        self._scanned = {key for key in self._scanned if key[0] != channel_id}
+        keys = [key for key in self._messages if key[0] == channel_id]
+        if keys:
+            for key in keys:
+                del self._messages[key]
+            await db.delete_channel_panels(channel_id)
+
+    async def find(self, channel: discord.abc.Messageable, kind: str, *, limit: int = 30) -> Optional[discord.PartialMessage]:
+        """Panneau connu du salon ; sinon un seul parcours de l'historique (panneaux d'avant la table)."""
+        message_id = self.get(channel.id, kind)
+        if message_id is None and (channel.id, kind) not in self._scanned:
+            self._scanned.add((channel.id, kind))
+            try:
+                async for msg in channel.history(limit=limit):
+                    if msg.author == channel.guild.me and msg.components:
+                        message_id = msg.id
+                        await self.set(channel.id, kind, message_id)
+                        break
+            except (discord.Forbidden, discord.HTTPException):
+                return None
+        return channel.get_partial_message(message_id) if message_id is not None else None
+
+    async def ensure(
+        self,
+        channel: discord.abc.Messageable,
+        kind: str,
+        build: Callable[[], Any],
+        *,
+        verify: bool = True,
+        pin: bool = False,
+    ) -> None:
+        """Publie le panneau s'il n'existe pas. `build` renvoie (embed, view)."""
+        panel = await self.find(channel, kind)
+        if panel is not None and verify:
+            try:
+                await panel.fetch()
+            except discord.NotFound:
+                await self.forget(channel.id, kind)
+                panel = None
+            except (discord.Forbidden, discord.HTTPException):
+                return
+        if panel is not None:
+            return
+
+        embed, view = await build()
+        try:
+            msg = await channel.send(embed=embed, view=view)
+        except (discord.Forbidden, discord.HTTPException):
+            return
+        await self.set(channel.id, kind, msg.id)
+        if pin:
+            try:
+                await msg.pin()
+            except (discord.Forbidden, discord.HTTPException):
+                pass
+
+
+panels = PanelRegistry()
+
+
 def is_custom_voice(channel: Optional[discord.abc.GuildChannel]) -> bool:
-    return isinstance(channel, discord.VoiceChannel) and db.get_custom_voice_owner(channel.id) is not None
+    return isinstance(channel, discord.VoiceChannel) and channel.id in custom_voices
 
 
 def is_create_voice_trigger(channel: Optional[discord.abc.GuildChannel]) -> bool:
     if not isinstance(channel, discord.VoiceChannel): return False
-    return slug(channel.name) in {slug(n) for n in CREATE_VOICE_TRIGGER_ALIASES}
+    return channel.id in channel_index.of(channel.guild).trigger_ids
 
 
 def custom_voice_locked(channel: discord.VoiceChannel) -> bool:
-    player_role = discord.utils.get(channel.guild.roles, name=PLAYER_ROLE)
+    player_role = role_registry.get(channel.guild, PLAYER_ROLE)
     if player_role is None:
         return False
     overwrite = channel.overwrites_for(player_role)
@@ -765,14 +1728,73 @@ def custom_voice_locked(channel: discord.VoiceChannel) -> bool:
 def can_manage_custom_voice(member: discord.Member, channel: Optional[discord.VoiceChannel]) -> bool:
     if not isinstance(channel, discord.VoiceChannel):
         return False
-    owner_id = db.get_custom_voice_owner(channel.id)
+    owner_id = custom_voices.owner(channel.id)
     return owner_id is not None and (member.id == owner_id or has_orga_access(member))
 
 
+class RoleRegistry:
+    """Index des rôles par serveur : nom -> id, et rang -> id (rôles décorés compris).
+
+    Construit à la première utilisation d'un serveur puis reconstruit par les
+    événements de rôles ; les recherches ne parcourent plus `guild.roles`.
+    """
+
+    def __init__(self):
+        self._by_name: Dict[int, Dict[str, int]] = {}
+        self._by_rank: Dict[int, Dict[str, int]] = {}
+
+    def refresh(self, guild: discord.Guild) -> None:
+        by_name: Dict[str, int] = {}
+        exact: Dict[str, int] = {}
+        slugged: Dict[str, int] = {}
+        decorated: Dict[str, int] = {}
+        rank_by_slug = {slug(rank_name): rank_name for rank_name, _ in RANK_OPTIONS}
+        for role in guild.roles:
+            by_name.setdefault(role.name, role.id)
+            if role.name in RANK_VALUE_BY_NAME:
+                exact.setdefault(role.name, role.id)
+            rank_from_slug = rank_by_slug.get(slug(role.name))
+            if rank_from_slug is not None:
+                slugged.setdefault(rank_from_slug, role.id)
+            rank_from_label = rank_name_for_label(role.name)
+            if rank_from_label is not None:
+                decorated.setdefault(rank_from_label, role.id)
+        # Priorité : nom exact, puis nom simplifié, puis rôle décoré.
+        self._by_name[guild.id] = by_name
+        self._by_rank[guild.id] = {**decorated, **slugged, **exact}
+
+    def forget(self, guild_id: int) -> None:
+        self._by_name.pop(guild_id, None)
+        self._by_rank.pop(guild_id, None)
+
+    def _resolve(self, guild: discord.Guild, index: Dict[int, Dict[str, int]], key: str) -> Optional[discord.Role]:
+        if guild.id not in index:
+            self.refresh(guild)
+        role_id = index[guild.id].get(key)
+        if role_id is None:
+            return None
+        role = guild.get_role(role_id)
+        if role is None:  # événement manqué : on reconstruit une fois
+            self.refresh(guild)
+            role_id = index[guild.id].get(key)
+            role = guild.get_role(role_id) if role_id is not None else None
+        return role
+
+    def get(self, guild: discord.Guild, name: str) -> Optional[discord.Role]:
+        return self._resolve(guild, self._by_name, name)
+
+    def rank_role(self, guild: discord.Guild, rank_name: str) -> Optional[discord.Role]:
+        return self._resolve(guild, self._by_rank, rank_name)
+
+
+role_registry = RoleRegistry()
+
+
 async def ensure_role(guild: discord.Guild, role_name: str, *, color: Optional[discord.Color] = None) -> discord.Role:
-    role = discord.utils.get(guild.roles, name=role_name)
+    role = role_registry.get(guild, role_name)
     if role is None:
         role = await guild.create_role(name=role_name, color=color or discord.Color.default(), reason="PP setup")
+        role_registry.refresh(guild)
     return role
 
 
@@ -973,10 +1995,7 @@ async def set_verification_permissions(guild: discord.Guild) -> None:
         )
 
     for channel_name in PREP_CHANNEL_NAMES:
-        prep = discord.utils.find(
-            lambda c: isinstance(c, discord.VoiceChannel) and slug(c.name) == slug(channel_name),
-            guild.channels,
-        )
+        prep = find_prep_voice(guild, channel_name)
         if prep is not None:
             await _configure_voice_channel(
                 prep,
@@ -1043,7 +2062,8 @@ async def create_custom_voice_channel(guild: discord.Guild, owner: discord.Membe
     if not isinstance(category, discord.CategoryChannel):
         category = find_category(guild, CUSTOM_VOICE_CATEGORY_NAME) or find_category(guild, ARTISANS_CATEGORY_NAME)
     channel = await guild.create_voice_channel(name=name, category=category, user_limit=max(0, min(99, user_limit)))
-    db.register_custom_voice(channel.id, owner.id)
+    await custom_voices.register(channel.id, owner.id)
+    panels.mark_empty(channel.id, "cvoice")
     await set_custom_voice_permissions(channel, owner=owner, locked=False)
     try:
         await owner.move_to(channel)
@@ -1054,7 +2074,8 @@ async def create_custom_voice_channel(guild: discord.Guild, owner: discord.Membe
 
 async def cleanup_custom_voice_if_empty(channel: discord.VoiceChannel) -> None:
     if is_custom_voice(channel) and len(channel.members) == 0:
-        db.delete_custom_voice(channel.id)
+        await custom_voices.remove(channel.id)
+        await panels.forget_channel(channel.id)
         try:
             await channel.delete(reason="Temporary custom voice empty")
         except (discord.Forbidden, discord.HTTPException):
@@ -1062,7 +2083,7 @@ async def cleanup_custom_voice_if_empty(channel: discord.VoiceChannel) -> None:
 
 
 async def _build_custom_voice_panel_embed(channel: discord.VoiceChannel) -> discord.Embed:
-    owner_id = db.get_custom_voice_owner(channel.id)
+    owner_id = custom_voices.owner(channel.id)
     owner = channel.guild.get_member(owner_id) if owner_id else None
     embed = discord.Embed(
         title=f"🎤 {channel.name}",
@@ -1080,30 +2101,24 @@ async def _build_custom_voice_panel_embed(channel: discord.VoiceChannel) -> disc
     return embed
 
 
-async def ensure_custom_voice_panel(channel: discord.VoiceChannel) -> None:
-    try:
-        async for msg in channel.history(limit=30):
-            if msg.author == channel.guild.me and msg.components:
-                return
-    except (discord.Forbidden, discord.HTTPException):
-        return
+async def _custom_voice_panel_content(channel: discord.VoiceChannel) -> Tuple[discord.Embed, discord.ui.View]:
+    return await _build_custom_voice_panel_embed(channel), CustomVoiceControlView()
 
-    try:
-        msg = await channel.send(embed=await _build_custom_voice_panel_embed(channel), view=CustomVoiceControlView())
-        try:
-            await msg.pin()
-        except (discord.Forbidden, discord.HTTPException):
-            pass
-    except (discord.Forbidden, discord.HTTPException):
-        pass
+
+async def ensure_custom_voice_panel(channel: discord.VoiceChannel) -> None:
+    await panels.ensure(channel, "cvoice", lambda: _custom_voice_panel_content(channel), verify=False, pin=True)
 
 
 async def refresh_custom_voice_panel(channel: discord.VoiceChannel) -> None:
+    panel = await panels.find(channel, "cvoice")
+    if panel is None:
+        return
     try:
-        async for msg in channel.history(limit=30):
-            if msg.author == channel.guild.me and msg.components:
-                await msg.edit(embed=await _build_custom_voice_panel_embed(channel), view=CustomVoiceControlView())
-                return
+        await panel.edit(embed=await _build_custom_voice_panel_embed(channel), view=CustomVoiceControlView())
+    except discord.NotFound:
+        # Panneau supprimé à la main : on l'oublie et on le republie.
+        await panels.forget(channel.id, "cvoice")
+        await ensure_custom_voice_panel(channel)
     except (discord.Forbidden, discord.HTTPException):
         return
 
@@ -1134,12 +2149,12 @@ async def apply_rank(member: discord.Member, rank_name: str) -> None:
         except discord.Forbidden:
             pass
 
-    db.upsert_player_rank(member.id, rank_name)
+    await db.upsert_player_rank(member.id, rank_name)
 
 
 async def clear_team_roles(guild: discord.Guild, members: Optional[List[discord.Member]] = None) -> None:
-    attack_role = discord.utils.get(guild.roles, name=TEAM_ATTACK_ROLE)
-    defense_role = discord.utils.get(guild.roles, name=TEAM_DEFENSE_ROLE)
+    attack_role = role_registry.get(guild, TEAM_ATTACK_ROLE)
+    defense_role = role_registry.get(guild, TEAM_DEFENSE_ROLE)
     if attack_role is None or defense_role is None:
         return
 
@@ -1154,8 +2169,8 @@ async def clear_team_roles(guild: discord.Guild, members: Optional[List[discord.
 
 
 async def apply_team_roles(guild: discord.Guild, attack: List[discord.Member], defense: List[discord.Member]) -> None:
-    attack_role = discord.utils.get(guild.roles, name=TEAM_ATTACK_ROLE)
-    defense_role = discord.utils.get(guild.roles, name=TEAM_DEFENSE_ROLE)
+    attack_role = role_registry.get(guild, TEAM_ATTACK_ROLE)
+    defense_role = role_registry.get(guild, TEAM_DEFENSE_ROLE)
     if attack_role is None or defense_role is None:
         return
 
@@ -1200,19 +2215,20 @@ def ordered_prep_members(channel: discord.VoiceChannel) -> List[discord.Member]:
     return sorted(members, key=lambda m: (order_map.get(m.id, 10**12), m.display_name.lower()))
 
 
-def _effective_player_skill(member: discord.Member) -> float:
-    raw = float(max(1, rank_value_for_member(member)))
+def _skill_from_rank_value(rank_value: int) -> float:
+    raw = float(max(1, rank_value))
     return (raw ** 1.12) + (22.0 * math.log1p(raw)) + (8.0 * math.sqrt(raw))
 
 
-def _team_balance_cost(team_a: List[discord.Member], team_b: List[discord.Member]) -> float:
-    skills_a = sorted((_effective_player_skill(m) for m in team_a), reverse=True)
-    skills_b = sorted((_effective_player_skill(m) for m in team_b), reverse=True)
+def _team_balance_cost(skills_a: List[float], skills_b: List[float]) -> float:
+    """Coût d'équilibrage entre deux équipes (0 = parfaitement équilibrées)."""
+    skills_a = sorted(skills_a, reverse=True)
+    skills_b = sorted(skills_b, reverse=True)
 
     sum_a, sum_b = sum(skills_a), sum(skills_b)
-    mean_a, mean_b = statistics.fmean(skills_a), statistics.fmean(skills_b)
-    stdev_a = statistics.pstdev(skills_a) if len(skills_a) > 1 else 0.0
-    stdev_b = statistics.pstdev(skills_b) if len(skills_b) > 1 else 0.0
+    mean_a, mean_b = sum_a / len(skills_a), sum_b / len(skills_b)
+    stdev_a = math.sqrt(sum((x - mean_a) * (x - mean_a) for x in skills_a) / len(skills_a))
+    stdev_b = math.sqrt(sum((x - mean_b) * (x - mean_b) for x in skills_b) / len(skills_b))
 
     top2_a, top2_b = sum(skills_a[:2]), sum(skills_b[:2])
     bot2_a, bot2_b = sum(skills_a[-2:]), sum(skills_b[-2:])
@@ -1228,61 +2244,250 @@ def _team_balance_cost(team_a: List[discord.Member], team_b: List[discord.Member
     )
 
 
-def split_balanced_teams(members: List[discord.Member]) -> Tuple[List[discord.Member], List[discord.Member]]:
-    if len(members) != 10:
-        scored = sorted(members, key=rank_value_for_member, reverse=True)
-        midpoint = len(scored) // 2
-        return scored[:midpoint], scored[midpoint:]
-
-    indexed = list(enumerate(members))
-    best_attack: List[discord.Member] = []
-    best_defense: List[discord.Member] = []
-    best_cost = float('inf')
-    best_raw_gap = float('inf')
-
-    for combo in combinations(indexed, 5):
-        attack_indices = {idx for idx, _ in combo}
-        attack = [member for idx, member in indexed if idx in attack_indices]
-        defense = [member for idx, member in indexed if idx not in attack_indices]
+def _karmarkar_karp_split(ranked: List[float], size: int) -> Tuple[List[int], List[int]]:
+    """Répartition initiale par différenciation de Karmarkar-Karp à effectifs imposés.
+
+    Les joueurs sont appariés dans l'ordre du classement (un de chaque côté), puis les
+    paires sont fusionnées en opposant toujours les deux plus gros écarts. Un joueur
+    fictif de skill 0 complète les lobbys impairs et désigne la petite équipe.
+    """
+    values = list(ranked)
+    if len(values) % 2:
+        values.append(0.0)
+    dummy = len(ranked)
+    heap = []
+    for p in range(0, len(values), 2):
+        heavy, light = (p, p + 1) if values[p] >= values[p + 1] else (p + 1, p)
+        heapq.heappush(heap, (-(values[heavy] - values[light]), p, [heavy], [light]))
+    while len(heap) > 1:
+        gap_x, tie, heavy_x, light_x = heapq.heappop(heap)
+        gap_y, _, heavy_y, light_y = heapq.heappop(heap)
+        heapq.heappush(heap, (gap_x - gap_y, tie, heavy_x + light_y, light_x + heavy_y))
+    _, _, first, second = heap[0]
+    if dummy in second:
+        first, second = second, first
+    first = sorted(p for p in first if p != dummy)
+    second = sorted(p for p in second if p != dummy)
+    return first, second
+
+
+def _improve_by_swaps(ranked: List[float], first: List[int], second: List[int],
+                      deadline: float) -> Tuple[List[int], List[int], float]:
+    """Échanges 1-contre-1 tant qu'un échange fait baisser le coût."""
+    cost = _team_balance_cost([ranked[p] for p in first], [ranked[p] for p in second])
+    improved = True
+    while improved and time.perf_counter() < deadline:
+        improved = False
+        for i in range(len(first)):
+            for j in range(len(second)):
+                first[i], second[j] = second[j], first[i]
+                candidate = _team_balance_cost([ranked[p] for p in first], [ranked[p] for p in second])
+                if candidate < cost - 1e-9:
+                    cost = candidate
+                    improved = True
+                else:
+                    first[i], second[j] = second[j], first[i]
+    return sorted(first), sorted(second), cost
+
+
+def _branch_and_bound_split(ranked: List[float], raw_ranked: List[int], size: int,
+                            deadline: float) -> Tuple[Tuple[int, ...], Tuple[int, ...]]:
+    """Répartition optimale (même coût que `_team_balance_cost`) pour les grands lobbys.
+
+    Les joueurs sont placés du plus fort au plus faible. Une branche est coupée dès que
+    l'écart de somme et de moyenne encore atteignable dépasse le meilleur coût connu.
+    Si le budget de temps est épuisé, la meilleure répartition trouvée est renvoyée.
+    """
+    count = len(ranked)
+    other = count - size
+    total = sum(ranked)
+    prefix = [0.0]
+    for value in ranked:
+        prefix.append(prefix[-1] + value)
+    pivots = (total / 2, total * size / count)
+
+    def gap_cost(sum_a: float) -> float:
+        sum_b = total - sum_a
+        return abs(sum_a - sum_b) + 0.65 * abs(sum_a / size - sum_b / other)
+
+    def lower_bound(position: int, need_a: int, sum_a: float) -> float:
+        low = sum_a + prefix[count] - prefix[count - need_a]
+        high = sum_a + prefix[position + need_a] - prefix[position]
+        candidates = [low, high] + [x for x in pivots if low <= x <= high]
+        bound = min(gap_cost(x) for x in candidates)
+        # Placés du plus fort au plus faible : les deux premiers de chaque équipe sont son top 2.
+        if len(team_a) >= 2 and len(team_b) >= 2:
+            top2_a = ranked[team_a[0]] + ranked[team_a[1]]
+            top2_b = ranked[team_b[0]] + ranked[team_b[1]]
+            bound += 0.55 * abs(top2_a - top2_b)
+        return bound
+
+    first, second = _karmarkar_karp_split(ranked, size)
+    first, second, best_cost = _improve_by_swaps(ranked, first, second, deadline)
+    best = (tuple(first), tuple(second))
+    best_gap = abs(sum(raw_ranked[p] for p in first) - sum(raw_ranked[p] for p in second))
+
+    team_a: List[int] = []
+    team_b: List[int] = []
+    nodes = 0
+
+    def visit(position: int, sum_a: float) -> bool:
+        nonlocal best, best_cost, best_gap, nodes
+        nodes += 1
+        if nodes % 2048 == 0 and time.perf_counter() > deadline:
+            return False
+        if position == count:
+            cost = _team_balance_cost([ranked[p] for p in team_a], [ranked[p] for p in team_b])
+            gap = abs(sum(raw_ranked[p] for p in team_a) - sum(raw_ranked[p] for p in team_b))
+            if cost < best_cost - 1e-9 or (cost <= best_cost + 1e-9 and gap < best_gap):
+                best, best_cost, best_gap = (tuple(team_a), tuple(team_b)), cost, gap
+            return True
+        need_a = size - len(team_a)
+        if lower_bound(position, need_a, sum_a) >= best_cost - 1e-9:
+            return True
+
+        # La position 0 reste dans la première équipe quand les effectifs sont égaux (miroirs).
+        # Deux joueurs de même skill sont interchangeables : dans une série d'égaux, ceux de
+        # la première équipe passent toujours avant ceux de la seconde.
+        choices = [True] if position == 0 and size == other else [True, False]
+        if position and ranked[position] == ranked[position - 1] and team_b and team_b[-1] == position - 1:
+            choices = [False]
+        if len(choices) == 2 and sum_a > prefix[position] - sum_a:
+            choices.reverse()  # on renforce d'abord l'équipe la plus faible
+        for to_a in choices:
+            if to_a and need_a > 0:
+                team_a.append(position)
+                keep_going = visit(position + 1, sum_a + ranked[position])
+                team_a.pop()
+            elif not to_a and len(team_b) < other:
+                team_b.append(position)
+                keep_going = visit(position + 1, sum_a)
+                team_b.pop()
+            else:
+                continue
+            if not keep_going:
+                return False
+        return True
 
-        cost = _team_balance_cost(attack, defense)
-        raw_gap = abs(sum(rank_value_for_member(m) for m in attack) - sum(rank_value_for_member(m) for m in defense))
+    visit(0, 0.0)
+    return best
 
-        if cost < best_cost - 1e-9 or (abs(cost - best_cost) <= 1e-9 and raw_gap < best_raw_gap):
-            best_cost = cost
-            best_raw_gap = raw_gap
-            best_attack = attack
-            best_defense = defense
 
-    return best_attack, best_defense
+def _team_landmarks(positions: Tuple[int, ...], count: int) -> Tuple[int, int, int, int, int, int]:
+    """Positions des 2 meilleurs, des 2 derniers et du (des) joueur(s) médian(s) d'une équipe.
+
+    `count` désigne une case valant 0.0 : une équipe d'un seul joueur n'a pas de second.
+    """
+    padded = positions if len(positions) > 1 else (positions[0], count)
+    middle = len(positions) // 2
+    low_mid = positions[middle] if len(positions) % 2 else positions[middle - 1]
+    return padded[0], padded[1], padded[-2], padded[-1], low_mid, positions[middle]
+
+
+@functools.lru_cache(maxsize=None)
+def _split_table(count: int, size: int) -> tuple:
+    """Toutes les répartitions de `count` joueurs classés par skill décroissant, calculées une fois.
+
+    Les positions d'une équipe sont croissantes, donc ses skills sortent déjà triés.
+    Quand les équipes ont la même taille, la position 0 reste dans la première :
+    une répartition miroir a exactement le même coût.
+    """
+    everyone = range(count)
+    combos = combinations(everyone, size)
+    if count == 2 * size:
+        combos = islice(combos, math.comb(count - 1, size - 1))  # celles qui contiennent 0
+    table = []
+    for first in combos:
+        second = tuple(i for i in everyone if i not in first)
+        getter = operator.itemgetter(*first) if size > 1 else (lambda values, only=first[0]: (values[only],))
+        table.append((getter, *_team_landmarks(first, count), *_team_landmarks(second, count), first, second))
+    return tuple(table)
+
+
+def _score_splits(ranked: List[float], size: int) -> List[float]:
+    """Coût de chaque répartition de `_split_table`, en un seul passage sur la table.
+
+    Même coût que `_team_balance_cost`, calculé à partir des totaux du lobby : la
+    seconde équipe s'obtient par différence et la variance par les sommes de carrés
+    recentrées sur la moyenne du lobby.
+    """
+    count = len(ranked)
+    other = count - size
+    total = sum(ranked)
+    center = math.fsum(ranked) / count
+    squares = [(x - center) * (x - center) for x in ranked]
+    total_squares = sum(squares)
+    r = ranked + [0.0]
+    sqrt = math.sqrt
+
+    costs = []
+    for get_a, a0, a1, a2, a3, am, am2, b0, b1, b2, b3, bm, bm2, _, _ in _split_table(count, size):
+        sum_a = sum(get_a(r))
+        sum_b = total - sum_a
+        squares_a = sum(get_a(squares))
+        mean_a, mean_b = sum_a / size, sum_b / other
+        shift_a, shift_b = mean_a - center, mean_b - center
+        var_a = squares_a / size - shift_a * shift_a
+        var_b = (total_squares - squares_a) / other - shift_b * shift_b
+        stdev_a = sqrt(var_a) if size > 1 and var_a > 0 else 0.0
+        stdev_b = sqrt(var_b) if other > 1 and var_b > 0 else 0.0
+        costs.append(
+            abs(sum_a - sum_b)
+            + 0.65 * abs(mean_a - mean_b)
+            + 0.40 * abs(stdev_a - stdev_b)
+            + 0.55 * abs(r[a0] + r[a1] - r[b0] - r[b1])
+            + 0.35 * abs(r[a2] + r[a3] - r[b2] - r[b3])
+            + 0.25 * abs((r[am] + r[am2]) / 2 - (r[bm] + r[bm2]) / 2)
+        )
+    return costs
+
+
+def split_balanced_teams(members: List[discord.Member],
+                         stored_ranks: Dict[int, str]) -> Tuple[List[discord.Member], List[discord.Member]]:
+    """Répartit le lobby (2 à 20 joueurs) en deux équipes ; l'attaque a `len(members) // 2` joueurs."""
+    count = len(members)
+    if count < 2:
+        return [], list(members)
+
+    # Les rangs et skills sont résolus une seule fois par lancement.
+    raw_values = [rank_value_for_member(m, stored_ranks.get(m.id)) for m in members]
+    skills = [_skill_from_rank_value(value) for value in raw_values]
+    order = sorted(range(count), key=skills.__getitem__, reverse=True)
+    ranked = [skills[i] for i in order]
+    size = count // 2
+    symmetric = count == 2 * size
+
+    if count <= BALANCE_TABLE_MAX:
+        table = _split_table(count, size)
+        costs = _score_splits(ranked, size)
+        best_cost = min(costs)
+        candidates = [(entry[-2], entry[-1]) for cost, entry in zip(costs, table) if cost <= best_cost + 1e-9]
+    else:
+        raw_ranked = [raw_values[i] for i in order]
+        deadline = time.perf_counter() + BALANCE_TIME_BUDGET
+        candidates = [_branch_and_bound_split(ranked, raw_ranked, size, deadline)]
+
+    # Meilleur coût (à 1e-9 près), puis plus petit écart de rang brut, puis la première
+    # répartition dans l'ordre des arrivées, attaque contenant le premier arrivé.
+    best_key = None
+    best_split: Tuple[Tuple[int, ...], Tuple[int, ...]] = ((), ())
+    for first, second in candidates:
+        attack_idx = tuple(sorted(order[p] for p in first))
+        defense_idx = tuple(sorted(order[p] for p in second))
+        if symmetric and 0 in defense_idx:
+            attack_idx, defense_idx = defense_idx, attack_idx
+        raw_gap = abs(sum(raw_values[i] for i in attack_idx) - sum(raw_values[i] for i in defense_idx))
+        key = (raw_gap, attack_idx)
+        if best_key is None or key < best_key:
+            best_key = key
+            best_split = (attack_idx, defense_idx)
+
+    attack_idx, defense_idx = best_split
+    return [members[i] for i in attack_idx], [members[i] for i in defense_idx]
 
 
 def get_associated_team_channels(prep_channel: discord.VoiceChannel) -> Tuple[Optional[discord.VoiceChannel], Optional[discord.VoiceChannel]]:
-    category = prep_channel.category
-    if category is None:
-        return None, None
-
-    voices = sorted(category.voice_channels, key=lambda c: c.position)
-    try:
-        prep_index = next(i for i, vc in enumerate(voices) if vc.id == prep_channel.id)
-    except StopIteration:
-        return None, None
-
-    next_prep_index = len(voices)
-    for i in range(prep_index + 1, len(voices)):
-        if is_prep_voice(voices[i]):
-            next_prep_index = i
-            break
-
-    attack = None
-    defense = None
-    for vc in voices[prep_index + 1:next_prep_index]:
-        name = slug(vc.name)
-        if "attaque" in name or "atk" in name or name.endswith("att"):
-            attack = vc
-        if "defense" in name or "def" in name:
-            defense = vc
-    return attack, defense
+    return channel_index.team_channels(prep_channel)
 
 
 async def move_teams_if_possible(prep_channel: discord.VoiceChannel, attack: List[discord.Member], defense: List[discord.Member]) -> None:
@@ -1314,8 +2519,8 @@ def map_image_url(map_name: str) -> Optional[str]:
     return MAP_IMAGE.get(map_name)
 
 
-def load_match_state(prep_channel_id: int) -> Optional[MatchState]:
-    row = db.get_active_match(prep_channel_id)
+async def load_match_state(prep_channel_id: int) -> Optional[MatchState]:
+    row = await db.get_active_match(prep_channel_id)
     return MatchState.from_row(row) if row else None
 
 
@@ -1331,8 +2536,8 @@ def format_mentions(members: List[discord.Member]) -> str:
     return "\n".join(member.mention for member in members) if members else "—"
 
 
-def persist_match_state(state: MatchState) -> None:
-    db.save_active_match(
+async def persist_match_state(state: MatchState) -> None:
+    await db.save_active_match(
         prep_channel_id=state.prep_channel_id,
         started_by_id=state.started_by_id,
         ui_message_id=state.ui_message_id,
@@ -1351,8 +2556,8 @@ def build_match_embeds(guild: discord.Guild, state: MatchState) -> List[discord.
     prep_channel = guild.get_channel(state.prep_channel_id)
     prep_name = prep_channel.name if isinstance(prep_channel, discord.VoiceChannel) else "Préparation"
     current_members = ordered_prep_members(prep_channel) if isinstance(prep_channel, discord.VoiceChannel) else []
-    selected_members = current_members[:10]
-    waiting_members = current_members[10:]
+    selected_members = current_members[:PP_MAX_PLAYERS]
+    waiting_members = current_members[PP_MAX_PLAYERS:]
 
     status_line = "✅ Map acceptée" if state.map_locked else "🗳️ Vote map ouvert"
     if state.attack_ids and state.defense_ids:
@@ -1386,15 +2591,15 @@ def build_match_embeds(guild: discord.Guild, state: MatchState) -> List[discord.
         name="👥 Joueurs détectés dans la voc",
         value=(
             f"**{len(current_members)}** joueur(s) présent(s).\n"
-            f"La PP prend les **10 premiers arrivés** s'il y a plus de 10 joueurs."
+            f"La PP prend les **{PP_MAX_PLAYERS} premiers arrivés** s'il y a plus de {PP_MAX_PLAYERS} joueurs."
         ),
         inline=False,
     )
 
     if selected_members:
-        details.add_field(name="🎮 Top 10 pris en compte", value=format_mentions(selected_members), inline=False)
+        details.add_field(name=f"🎮 Top {PP_MAX_PLAYERS} pris en compte", value=format_mentions(selected_members), inline=False)
     if waiting_members:
-        details.add_field(name="⏳ Hors top 10", value=format_mentions(waiting_members), inline=False)
+        details.add_field(name=f"⏳ Hors top {PP_MAX_PLAYERS}", value=format_mentions(waiting_members), inline=False)
 
     if state.attack_ids and state.defense_ids:
         attack_members = [guild.get_member(user_id) for user_id in state.attack_ids]
@@ -1408,21 +2613,89 @@ def build_match_embeds(guild: discord.Guild, state: MatchState) -> List[discord.
     return [header, details]
 
 
-async def refresh_match_message(guild: discord.Guild, prep_channel_id: int) -> None:
-    state = load_match_state(prep_channel_id)
-    if state is None:
-        return
-    prep_channel = guild.get_channel(prep_channel_id)
-    if not isinstance(prep_channel, discord.VoiceChannel):
-        return
-    try:
-        message = await prep_channel.fetch_message(state.ui_message_id)
-    except (discord.NotFound, discord.Forbidden, discord.HTTPException):
-        return
-    try:
-        await message.edit(embeds=build_match_embeds(guild, state), view=PPMatchView())
-    except (discord.Forbidden, discord.HTTPException):
-        pass
+class MatchPanelCoalescer:
+    """Regroupe les éditions du panneau de match : au plus une par intervalle et par salon.
+
+    Les arrivées/départs marquent le panneau comme à rafraîchir ; l'édition part sur
+    le message partiel (sans refetch) et est sautée si le rendu n'a pas changé.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._pending: Dict[int, asyncio.Task] = {}
+        self._running: Set[asyncio.Task] = set()  # référence forte jusqu'à la fin de l'édition
+        self._last_flush: Dict[int, float] = {}
+        self._rendered: Dict[int, Tuple[int, str]] = {}
+        self.edits = 0
+        self.unchanged = 0
+        self.coalesced = 0
+
+    @staticmethod
+    def _digest(embeds: List[discord.Embed]) -> str:
+        payload = json.dumps([embed.to_dict() for embed in embeds], sort_keys=True, default=str)
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+    def render(self, guild: discord.Guild, state: MatchState) -> List[discord.Embed]:
+        """Construit les embeds et retient leur empreinte (éditions faites hors coalesceur)."""
+        embeds = build_match_embeds(guild, state)
+        self.remember(state, embeds)
+        return embeds
+
+    def remember(self, state: MatchState, embeds: List[discord.Embed]) -> None:
+        """Empreinte du rendu affiché par `state.ui_message_id` (à appeler une fois l'id connu)."""
+        self._rendered[state.prep_channel_id] = (state.ui_message_id, self._digest(embeds))
+
+    def mark(self, guild: discord.Guild, prep_channel_id: int) -> None:
+        if prep_channel_id in self._pending:
+            self.coalesced += 1
+            return
+        delay = max(0.0, self._last_flush.get(prep_channel_id, 0.0) + self.interval - time.monotonic())
+        task = asyncio.create_task(self._flush_later(guild, prep_channel_id, delay))
+        self._pending[prep_channel_id] = task
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _flush_later(self, guild: discord.Guild, prep_channel_id: int, delay: float) -> None:
+        if delay:
+            await asyncio.sleep(delay)
+        # Retiré avant l'édition : un changement pendant le flush reprogramme un passage.
+        self._pending.pop(prep_channel_id, None)
+        self._last_flush[prep_channel_id] = time.monotonic()
+        try:
+            await self._flush(guild, prep_channel_id)
+        except Exception as exc:
+            print(f"[PP] Rafraîchissement du panneau impossible ({prep_channel_id}) : {exc}")
+
+    async def _flush(self, guild: discord.Guild, prep_channel_id: int) -> None:
+        state = await load_match_state(prep_channel_id)
+        if state is None:
+            self._rendered.pop(prep_channel_id, None)
+            return
+        prep_channel = guild.get_channel(prep_channel_id)
+        if not isinstance(prep_channel, discord.VoiceChannel):
+            return
+        embeds = build_match_embeds(guild, state)
+        digest = self._digest(embeds)
+        if self._rendered.get(prep_channel_id) == (state.ui_message_id, digest):
+            self.unchanged += 1
+            return
+        try:
+            await prep_channel.get_partial_message(state.ui_message_id).edit(embeds=embeds, view=PPMatchView())
+        except (discord.NotFound, discord.Forbidden, discord.HTTPException):
+            return
+        self._rendered[prep_channel_id] = (state.ui_message_id, digest)
+        self.edits += 1
+
+    def stats(self) -> dict:
+        return {"edits": self.edits, "unchanged": self.unchanged, "coalesced": self.coalesced}
+
+
+match_panels = MatchPanelCoalescer(MATCH_PANEL_EDIT_INTERVAL)
+register_metrics("match_panels", match_panels.stats)
+
+
+def refresh_match_message(guild: discord.Guild, prep_channel_id: int) -> None:
+    match_panels.mark(guild, prep_channel_id)
 
 
 # ===================== RR TRACKER : CONFIG =====================
@@ -1435,6 +2708,30 @@ RR_DEFAULT_PLATFORM = os.getenv("RR_DEFAULT_PLATFORM", "pc")
 RR_PAGE_SIZE = int(os.getenv("RR_PAGE_SIZE", "10"))
 RR_DAILY_RECAP_HOUR = int(os.getenv("RR_DAILY_RECAP_HOUR", "23"))
 RR_TIMEZONE = os.getenv("RR_TIMEZONE", "Europe/Paris")
+# Quota de la clé HenrikDev (requêtes par fenêtre), ajusté ensuite par les en-têtes x-ratelimit-*.
+RR_API_RATE = int(os.getenv("RR_API_RATE", "30"))
+RR_API_WINDOW = float(os.getenv("RR_API_WINDOW", "60"))
+RR_POLL_CONCURRENCY = int(os.getenv("RR_POLL_CONCURRENCY", "4"))
+# Fréquence adaptative : RR_POLL_INTERVAL pour les comptes actifs, doublée à chaque passage
+# sans partie jusqu'à RR_POLL_MAX_INTERVAL. La boucle vérifie l'échéancier toutes les RR_SCHEDULER_TICK s.
+RR_POLL_MAX_INTERVAL = int(os.getenv("RR_POLL_MAX_INTERVAL", "3600"))
+RR_SCHEDULER_TICK = int(os.getenv("RR_SCHEDULER_TICK", "15"))
+# Cache des réponses API : mémoire (octets) puis SQLite pour les entrées longues.
+RR_API_CACHE_BYTES = int(os.getenv("RR_API_CACHE_BYTES", str(8 * 1024 * 1024)))
+RR_MATCH_CACHE_BYTES = int(os.getenv("RR_MATCH_CACHE_BYTES", str(4 * 1024 * 1024)))
+# Résilience : nouvelles tentatives (timeouts, 5xx, 429) puis disjoncteur si l'API est dégradée.
+RR_API_RETRIES = int(os.getenv("RR_API_RETRIES", "3"))
+RR_API_BACKOFF = float(os.getenv("RR_API_BACKOFF", "1.0"))
+RR_API_BREAKER_THRESHOLD = int(os.getenv("RR_API_BREAKER_THRESHOLD", "5"))
+RR_API_BREAKER_COOLDOWN = float(os.getenv("RR_API_BREAKER_COOLDOWN", "60"))
+RR_ACTIVE_WINDOW = timedelta(days=1)
+# Reprise de l'historique des nouveaux comptes : pages de RR_BACKFILL_PAGE_SIZE parties,
+# au plus RR_BACKFILL_MAX_PAGES par étape, sans descendre sous RR_BACKFILL_RESERVE du quota.
+RR_BACKFILL_PAGE_SIZE = int(os.getenv("RR_BACKFILL_PAGE_SIZE", "20"))
+RR_BACKFILL_MAX_PAGES = int(os.getenv("RR_BACKFILL_MAX_PAGES", "10"))
+RR_BACKFILL_RESERVE = max(0.0, min(0.9, float(os.getenv("RR_BACKFILL_RESERVE", "0.5"))))
+# Annonces : file par salon, jusqu'à 10 embeds par message, vidée toutes les RR_ANNOUNCE_INTERVAL s.
+RR_ANNOUNCE_INTERVAL = float(os.getenv("RR_ANNOUNCE_INTERVAL", "2.0"))
 
 VALID_REGIONS = ["eu", "na", "ap", "kr", "latam", "br"]
 
@@ -1506,6 +2803,266 @@ class ValorantAPIError(Exception):
     pass
 
 
+class ValorantAPITransientError(ValorantAPIError):
+    """Erreur passagère (timeout, réseau, 5xx, 429) : la requête peut être retentée."""
+
+    def __init__(self, message: str, *, rate_limited: bool = False):
+        super().__init__(message)
+        self.rate_limited = rate_limited
+
+
+class CircuitBreaker:
+    """Coupe tout le trafic vers l'API après une série d'échecs, puis teste une requête."""
+
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = max(1, threshold)
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.failures = 0
+        self.opened = 0
+        self._open_until = 0.0
+        self._trial: Optional[int] = None  # jeton de la requête d'essai en cours
+        self._tickets = count(1)
+
+    def is_open(self) -> bool:
+        return self.state == "open" and time.monotonic() < self._open_until
+
+    def allow(self) -> Optional[int]:
+        """Jeton de passage (0 hors essai), ou None si la requête est refusée."""
+        if self.state == "closed":
+            return 0
+        if self.state == "open":
+            if time.monotonic() < self._open_until:
+                return None
+            self.state = "half_open"
+            self._trial = None
+        if self._trial is not None:
+            return None  # une seule requête d'essai à la fois
+        self._trial = next(self._tickets)
+        return self._trial
+
+    def record_success(self) -> None:
+        self.state = "closed"
+        self.failures = 0
+        self._trial = None
+
+    def record_neutral(self, ticket: int) -> None:
+        """Réponse sans verdict sur la santé de l'API (429, annulation) : libère l'essai s'il est à elle."""
+        if ticket and ticket == self._trial:
+            self._trial = None
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.threshold:
+            if self.state != "open":
+                self.opened += 1
+                print(f"[RR] API Valorant dégradée : pause de {self.cooldown:.0f}s.")
+            self.state = "open"
+            self._open_until = time.monotonic() + self.cooldown
+            self._trial = None
+
+    def retry_in(self) -> float:
+        return max(0.0, self._open_until - time.monotonic()) if self.state == "open" else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "opened": self.opened,
+            "retry_in_s": round(self.retry_in(), 1),
+        }
+
+
+def _int_header(headers, name: str) -> Optional[int]:
+    value = headers.get(name)
+    try:
+        return int(float(value)) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Seau à jetons partagé par tous les appels à l'API.
+
+    Dimensionné sur le quota de la clé, puis recalé sur les en-têtes
+    x-ratelimit-limit / -remaining / -reset renvoyés par HenrikDev.
+    """
+
+    def __init__(self, rate: int, per: float):
+        self.capacity = float(max(1, rate))
+        self.per = per
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock: Optional[asyncio.Lock] = None
+        self.acquired = 0
+        self.waited = 0.0
+        self.spare_acquired = 0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.capacity / self.per)
+        self._updated = now
+
+    async def acquire(self) -> None:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        started = time.monotonic()
+        async with self._lock:  # file d'attente FIFO
+            while True:
+                now = time.monotonic()
+                if now < self._blocked_until:
+                    await asyncio.sleep(self._blocked_until - now)
+                    continue
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    break
+                await asyncio.sleep((1 - self.tokens) * self.per / self.capacity)
+        self.acquired += 1
+        self.waited += time.monotonic() - started
+
+    async def acquire_spare(self, reserve: float) -> None:
+        """Jeton basse priorité : seulement si personne n'attend et qu'il en reste au-delà
+        de la réserve (fraction de la capacité) gardée pour le suivi en direct.
+
+        Le seuil est borné à la capacité : un seau plein sert toujours la reprise,
+        même quand observe() a ramené la capacité à une petite limite d'en-tête.
+        """
+        while True:
+            now = time.monotonic()
+            if now < self._blocked_until:
+                await asyncio.sleep(self._blocked_until - now)
+                continue
+            self._refill()
+            floor = min(self.capacity, 1 + reserve * self.capacity)
+            if self.tokens >= floor and not (self._lock is not None and self._lock.locked()):
+                self.tokens -= 1
+                self.spare_acquired += 1
+                return
+            await asyncio.sleep(max(0.5, (floor - self.tokens) * self.per / self.capacity))
+
+    def observe(self, headers) -> None:
+        limit = _int_header(headers, "x-ratelimit-limit")
+        remaining = _int_header(headers, "x-ratelimit-remaining")
+        reset = _int_header(headers, "x-ratelimit-reset")
+        self._refill()
+        if limit and limit != self.capacity:
+            self.capacity = float(limit)
+            self.tokens = min(self.tokens, self.capacity)
+        if remaining is not None:
+            self.tokens = min(self.tokens, float(remaining))
+            if remaining <= 0 and reset:
+                self.pause(reset)
+
+    def pause(self, seconds: float) -> None:
+        self.tokens = 0.0
+        self._updated = time.monotonic()
+        self._blocked_until = max(self._blocked_until, self._updated + seconds)
+
+    def stats(self) -> dict:
+        return {
+            "capacity": self.capacity,
+            "window_s": self.per,
+            "tokens": round(self.tokens, 2),
+            "acquired": self.acquired,
+            "spare_acquired": self.spare_acquired,
+            "avg_wait_ms": round(self.waited / self.acquired * 1000, 2) if self.acquired else 0.0,
+            "paused_s": round(max(0.0, self._blocked_until - time.monotonic()), 1),
+        }
+
+
+def json_loads(data: Union[str, bytes]) -> Any:
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+def json_dumps(obj: Any) -> str:
+    if orjson is not None:
+        return orjson.dumps(obj).decode("utf-8")
+    return json.dumps(obj, separators=(",", ":"))
+
+
+# (préfixe de chemin, durée de vie en s, persisté en SQLite)
+API_CACHE_TTLS: List[Tuple[str, float, bool]] = [
+    ("/valorant/v2/account/", 24 * 3600, True),
+    ("/valorant/v2/by-puuid/account/", 24 * 3600, True),
+    ("/valorant/v3/by-puuid/mmr/", 60, False),
+    ("/valorant/v2/by-puuid/mmr-history/", 30, False),
+    ("/valorant/v4/by-puuid/matches/", 30, False),
+]
+
+
+class ResponseCache:
+    """Cache des réponses HenrikDev à deux niveaux : LRU mémoire puis table `api_cache`.
+
+    La durée de vie dépend de l'endpoint : longue pour la résolution pseudo -> puuid,
+    courte pour l'historique MMR et les matchs.
+    """
+
+    PURGE_EVERY = 200
+
+    def __init__(self, max_bytes: int):
+        self.memory = ByteLRU(max_bytes, sizeof=lambda item: item[2])
+        self.memory_hits = 0
+        self.sqlite_hits = 0
+        self.misses = 0
+        self._writes = 0
+
+    @staticmethod
+    def policy(path: str) -> Optional[Tuple[float, bool]]:
+        for prefix, ttl, persist in API_CACHE_TTLS:
+            if path.startswith(prefix):
+                return ttl, persist
+        return None
+
+    async def get(self, path: str) -> Optional[dict]:
+        policy = self.policy(path)
+        if policy is None:
+            return None
+        now = time.time()
+        item = self.memory.get(path)
+        if item is not None:
+            if item[0] > now:
+                self.memory_hits += 1
+                return item[1]
+            self.memory.pop(path)
+        if policy[1]:
+            stored = await db.api_cache_get(path, now)
+            if stored is not None:
+                payload_text, expires_at = stored
+                payload = json_loads(payload_text)
+                self.memory.put(path, (expires_at, payload, len(payload_text)))
+                self.sqlite_hits += 1
+                return payload
+        self.misses += 1
+        return None
+
+    async def put(self, path: str, payload: dict) -> None:
+        policy = self.policy(path)
+        if policy is None:
+            return
+        ttl, persist = policy
+        expires_at = time.time() + ttl
+        payload_text = json_dumps(payload)
+        self.memory.put(path, (expires_at, payload, len(payload_text)))
+        if persist:
+            await db.api_cache_put(path, payload_text, expires_at)
+            self._writes += 1
+            if self._writes % self.PURGE_EVERY == 0:
+                await db.api_cache_purge(time.time())
+
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.sqlite_hits + self.misses
+        hits = self.memory_hits + self.sqlite_hits
+        return {
+            "memory_hits": self.memory_hits,
+            "sqlite_hits": self.sqlite_hits,
+            "misses": self.misses,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "memory": self.memory.stats(),
+        }
+
+
 class ValorantAPI:
     """Client de l'API communautaire HenrikDev (non officielle Riot)."""
 
@@ -1515,6 +3072,12 @@ class ValorantAPI:
         self.api_key = api_key
         self._session: Optional["aiohttp.ClientSession"] = None
         self._lock = asyncio.Lock()
+        self.bucket = TokenBucket(RR_API_RATE, RR_API_WINDOW)
+        self.cache = ResponseCache(RR_API_CACHE_BYTES)
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.coalesced = 0
+        self.breaker = CircuitBreaker(RR_API_BREAKER_THRESHOLD, RR_API_BREAKER_COOLDOWN)
+        self.retries = 0
 
     async def session(self):
         async with self._lock:
@@ -1532,28 +3095,108 @@ class ValorantAPI:
     async def _get(self, path: str) -> dict:
         if not self.api_key:
             raise ValorantAPIError("Clé API HenrikDev manquante (HENRIK_API_KEY dans le .env).")
+        cached = await self.cache.get(path)
+        if cached is not None:
+            return cached
+        # Requêtes identiques simultanées : un seul appel réseau, résultat partagé.
+        task = self._inflight.get(path)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch_and_store(path))
+            self._inflight[path] = task
+            task.add_done_callback(lambda _: self._inflight.pop(path, None))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    async def _fetch_and_store(self, path: str) -> dict:
+        payload = await self._fetch(path)
+        await self.cache.put(path, payload)
+        return payload
+
+    async def _fetch(self, path: str, low_priority: bool = False) -> dict:
+        """Requête avec nouvelles tentatives (backoff exponentiel avec jitter) et disjoncteur."""
+        attempt = 0
+        while True:
+            ticket = self.breaker.allow()
+            if ticket is None:
+                # Refus du disjoncteur (ouvert, ou essai du demi-ouvert déjà pris) : passager.
+                raise ValorantAPITransientError(
+                    f"API Valorant indisponible, nouvel essai dans {self.breaker.retry_in():.0f}s."
+                )
+            try:
+                payload = await self._request(path, low_priority)
+            except ValorantAPITransientError as exc:
+                if exc.rate_limited:
+                    self.breaker.record_neutral(ticket)
+                else:
+                    self.breaker.record_failure()
+                if attempt >= RR_API_RETRIES or self.breaker.is_open():
+                    raise
+                attempt += 1
+                self.retries += 1
+                # Sur 429, le seau à jetons est déjà en pause jusqu'à Retry-After.
+                if not exc.rate_limited:
+                    await asyncio.sleep(random.uniform(0, RR_API_BACKOFF * 2 ** attempt))
+                continue
+            except ValorantAPIError:
+                self.breaker.record_success()  # l'API répond : erreur métier, pas une panne
+                raise
+            except BaseException:
+                # Annulation (shield/single-flight, arrêt de tâche) ou erreur imprévue :
+                # aucun verdict, mais l'essai du demi-ouvert ne doit pas rester réservé.
+                self.breaker.record_neutral(ticket)
+                raise
+            self.breaker.record_success()
+            return payload
+
+    async def _request(self, path: str, low_priority: bool = False) -> dict:
         session = await self.session()
+        if low_priority:
+            await self.bucket.acquire_spare(RR_BACKFILL_RESERVE)
+        else:
+            await self.bucket.acquire()
         try:
             async with session.get(f"{self.BASE}{path}") as resp:
+                self.bucket.observe(resp.headers)
                 try:
-                    payload = await resp.json()
-                except Exception:
+                    payload = json_loads(await resp.read())
+                except ValueError:
                     payload = {}
                 if resp.status == 404:
                     raise ValorantAPIError("Joueur introuvable (vérifie le pseudo, le tag et la région).")
                 if resp.status == 429:
-                    raise ValorantAPIError("Limite de requêtes atteinte sur l'API Valorant, réessaie dans un instant.")
+                    self.bucket.pause(
+                        _int_header(resp.headers, "retry-after")
+                        or _int_header(resp.headers, "x-ratelimit-reset")
+                        or self.bucket.per
+                    )
+                    raise ValorantAPITransientError(
+                        "Limite de requêtes atteinte sur l'API Valorant, réessaie dans un instant.",
+                        rate_limited=True,
+                    )
                 if resp.status == 403:
                     raise ValorantAPIError("Clé API HenrikDev invalide ou expirée.")
+                if resp.status >= 500:
+                    raise ValorantAPITransientError(f"L'API Valorant est en difficulté ({resp.status}).")
                 if resp.status >= 400:
                     errors = payload.get("errors") or []
                     message = errors[0].get("message") if errors else f"Erreur API ({resp.status})"
                     raise ValorantAPIError(message)
                 return payload
         except asyncio.TimeoutError:
-            raise ValorantAPIError("L'API Valorant ne répond pas (timeout).")
+            raise ValorantAPITransientError("L'API Valorant ne répond pas (timeout).")
         except aiohttp.ClientError as exc:
-            raise ValorantAPIError(f"Erreur réseau vers l'API Valorant : {exc}")
+            raise ValorantAPITransientError(f"Erreur réseau vers l'API Valorant : {exc}")
+
+    def stats(self) -> dict:
+        return {
+            "rate_limit": self.bucket.stats(),
+            "cache": self.cache.stats(),
+            "coalesced": self.coalesced,
+            "in_flight": len(self._inflight),
+            "retries": self.retries,
+            "breaker": self.breaker.stats(),
+        }
 
     async def get_account(self, name: str, tag: str) -> dict:
         data = await self._get(f"/valorant/v2/account/{urllib.parse.quote(name)}/{urllib.parse.quote(tag)}")
@@ -1577,11 +3220,31 @@ class ValorantAPI:
         data = await self._get(path)
         return data.get("data") or []
 
+    async def _get_low_priority(self, path: str) -> dict:
+        """Pages d'archive (reprise d'historique) : hors cache, sur le quota non utilisé."""
+        if not self.api_key:
+            raise ValorantAPIError("Clé API HenrikDev manquante (HENRIK_API_KEY dans le .env).")
+        return await self._fetch(path, low_priority=True)
+
+    async def get_stored_mmr_history(self, region: str, puuid: str, platform: str = RR_DEFAULT_PLATFORM,
+                                     page: int = 1, size: int = RR_BACKFILL_PAGE_SIZE) -> list:
+        path = f"/valorant/v2/by-puuid/stored-mmr-history/{region}/{platform}/{puuid}?page={page}&size={size}"
+        data = await self._get_low_priority(path)
+        return data.get("data") or []
+
+    async def get_stored_matches(self, region: str, puuid: str, mode: str = "competitive",
+                                 page: int = 1, size: int = RR_BACKFILL_PAGE_SIZE) -> list:
+        path = f"/valorant/v1/by-puuid/stored-matches/{region}/{puuid}?mode={mode}&page={page}&size={size}"
+        data = await self._get_low_priority(path)
+        return data.get("data") or []
+
 
 valo_api = ValorantAPI(HENRIK_API_KEY)
+register_metrics("henrik_api", valo_api.stats)
 
 
 # ===================== RR TRACKER : PARSING DES MATCHS =====================
+
 def _extract_match_id(entry: dict) -> Optional[str]:
     for key in ("match_id", "matchid", "id"):
         if entry.get(key):
@@ -1634,94 +3297,331 @@ def _parse_match_date(entry: dict) -> Optional[datetime]:
         return datetime.fromtimestamp(raw, tz=timezone.utc)
     if isinstance(raw, str):
         try:
-            return datetime.fromisoformat(raw.replace("Z", "+00:00"))
+            parsed = datetime.fromisoformat(raw.replace("Z", "+00:00"))
         except ValueError:
             pass
+        else:
+            # Dates sans décalage : l'API les donne en UTC ; toujours comparables entre elles.
+            return parsed if parsed.tzinfo is not None else parsed.replace(tzinfo=timezone.utc)
     raw = entry.get("date_raw")
     if isinstance(raw, (int, float)):
         return datetime.fromtimestamp(raw, tz=timezone.utc)
     return None
 
 
-def _find_match_details(matches: List[dict], match_id: str, puuid: str) -> dict:
-    """Extrait score, agent et KDA d'une partie depuis la matchlist v4."""
-    details: Dict[str, object] = {}
-    target = None
-    for match in matches:
-        if _extract_match_id(match) == match_id:
-            target = match
-            break
-    if target is None:
-        return details
+class HistoryEntry:
+    """Une ligne d'historique MMR réduite aux champs utilisés par le tracker."""
 
-    details["map_name"] = _map_name_from_entry(target)
+    __slots__ = ("match_id", "tier_id", "tier_name", "rr", "rr_change", "elo", "map_name", "played_at")
 
-    players = target.get("players")
-    if isinstance(players, dict):
-        players = players.get("all_players") or []
-    players = players or []
+    def __init__(self, match_id, tier_id, tier_name, rr, rr_change, elo, map_name, played_at):
+        self.match_id = match_id
+        self.tier_id = tier_id
+        self.tier_name = tier_name
+        self.rr = rr
+        self.rr_change = rr_change
+        self.elo = elo
+        self.map_name = map_name
+        self.played_at = played_at
 
-    me = None
-    for player in players:
-        if str(player.get("puuid", "")).lower() == puuid.lower():
-            me = player
-            break
-    if me is None:
-        return details
 
-    agent = me.get("agent")
-    if isinstance(agent, dict):
-        details["agent_name"] = agent.get("name")
-        details["agent_id"] = agent.get("id")
-    else:
-        details["agent_name"] = me.get("character") or agent
-        details["agent_id"] = me.get("character_id")
+def _history_v2(entry: dict) -> HistoryEntry:
+    """mmr-history v2 : currenttier, ranking_in_tier, mmr_change_to_last_game, date_raw."""
+    raw = entry.get("date_raw")
+    return HistoryEntry(
+        _extract_match_id(entry), entry.get("currenttier"), entry.get("currenttier_patched"),
+        entry.get("ranking_in_tier"), entry.get("mmr_change_to_last_game"), entry.get("elo"),
+        (entry.get("map") or {}).get("name"),
+        datetime.fromtimestamp(raw, tz=timezone.utc) if isinstance(raw, (int, float)) else _parse_match_date(entry),
+    )
+
+
+def _history_stored(entry: dict) -> HistoryEntry:
+    """stored-mmr-history / format récent : tier {id, name}, rr, last_change, date ISO."""
+    tier = entry["tier"]
+    return HistoryEntry(
+        _extract_match_id(entry), tier.get("id"), tier.get("name"), entry.get("rr"),
+        entry.get("last_change"), entry.get("elo"), (entry.get("map") or {}).get("name"),
+        _parse_match_date(entry),
+    )
+
+
+def _history_generic(entry: dict) -> HistoryEntry:
+    """Forme inconnue : on sonde toutes les variantes de clés."""
+    tier_id, tier_name = _tier_from_entry(entry)
+    rr, change = _rr_from_entry(entry)
+    return HistoryEntry(_extract_match_id(entry), tier_id, tier_name, rr, change, entry.get("elo"),
+                        _map_name_from_entry(entry), _parse_match_date(entry))
+
+
+def _pick_adapter(sample: dict, adapters: List[Tuple[Callable[[dict], bool], Callable]], fallback: Callable) -> Callable:
+    for matches, adapter in adapters:
+        if matches(sample):
+            return adapter
+    return fallback
+
+
+def _adapt_all(entries: list, adapter: Callable, fallback: Callable) -> list:
+    """Applique l'adaptateur choisi ; une entrée atypique repasse par le parseur générique."""
+    records = []
+    for entry in entries:
+        try:
+            records.append(adapter(entry))
+        except (KeyError, TypeError, AttributeError):
+            records.append(fallback(entry))
+    return records
+
+
+HISTORY_ADAPTERS = [
+    (lambda e: isinstance(e.get("tier"), dict) and "last_change" in e and "match_id" in e, _history_stored),
+    (lambda e: "currenttier" in e and "match_id" in e, _history_v2),
+]
 
-    stats = me.get("stats") if isinstance(me.get("stats"), dict) else me
-    details["kills"] = stats.get("kills")
-    details["deaths"] = stats.get("deaths")
-    details["assists"] = stats.get("assists")
 
-    my_team = me.get("team_id") or me.get("team")
-    teams = target.get("teams")
-    won: Optional[bool] = None
-    rounds_won = rounds_lost = None
+def parse_history(entries: list) -> List[HistoryEntry]:
+    """Historique MMR -> HistoryEntry ; l'adaptateur est choisi une fois sur la première entrée."""
+    entries = [entry for entry in entries if isinstance(entry, dict)]
+    if not entries:
+        return []
+    adapter = _pick_adapter(entries[0], HISTORY_ADAPTERS, _history_generic)
+    return _adapt_all(entries, adapter, _history_generic)
 
-    if isinstance(teams, list):
-        for team in teams:
+
+class PlayerLine:
+    """Stats d'un joueur dans une partie."""
+
+    __slots__ = ("agent_name", "agent_id", "kills", "deaths", "assists", "team")
+
+    def __init__(self, agent_name, agent_id, kills, deaths, assists, team):
+        self.agent_name = agent_name
+        self.agent_id = agent_id
+        self.kills = kills
+        self.deaths = deaths
+        self.assists = assists
+        self.team = team
+
+
+class MatchRecord:
+    """Partie réduite : map, équipes (won, rounds gagnés, rounds perdus) et joueurs par puuid."""
+
+    __slots__ = ("match_id", "map_name", "teams", "players", "side_teams")
+
+    def __init__(self, match_id: Optional[str], map_name: Optional[str],
+                 teams: Dict[str, tuple], players: Dict[str, PlayerLine], side_teams: bool = False):
+        self.match_id = match_id
+        self.map_name = map_name
+        self.teams = teams
+        self.players = players
+        self.side_teams = side_teams  # format rouge/bleu : tout ce qui n'est pas rouge est bleu
+
+    def to_json(self) -> list:
+        players = {puuid: [getattr(line, slot) for slot in PlayerLine.__slots__]
+                   for puuid, line in self.players.items()}
+        return [self.match_id, self.map_name, self.teams, players, self.side_teams]
+
+    @classmethod
+    def from_json(cls, data: list) -> "MatchRecord":
+        match_id, map_name, teams, players, side_teams = data
+        return cls(match_id, map_name, {team: tuple(value) for team, value in teams.items()},
+                   {puuid: PlayerLine(*line) for puuid, line in players.items()}, side_teams)
+
+
+def _match_v4(match: dict) -> MatchRecord:
+    """matches v4 : players liste (agent/stats en objets), teams liste avec rounds {won, lost}."""
+    meta = match["metadata"]
+    players: Dict[str, PlayerLine] = {}
+    for player in match["players"]:
+        agent = player.get("agent") or {}
+        stats = player.get("stats") or {}
+        players.setdefault(player["puuid"].lower(), PlayerLine(
+            agent.get("name"), agent.get("id"), stats.get("kills"), stats.get("deaths"),
+            stats.get("assists"), str(player.get("team_id")).lower(),
+        ))
+    teams = {}
+    for team in match.get("teams") or []:
+        rounds = team.get("rounds") or {}
+        teams[str(team.get("team_id")).lower()] = (team.get("won"), rounds.get("won"), rounds.get("lost"))
+    return MatchRecord(_extract_match_id(meta), (meta.get("map") or {}).get("name"), teams, players)
+
+
+def _match_v3(match: dict) -> MatchRecord:
+    """matches v2/v3 : players.all_players, character, teams {red, blue} avec rounds_won."""
+    meta = match["metadata"]
+    players: Dict[str, PlayerLine] = {}
+    for player in match["players"]["all_players"]:
+        stats = player.get("stats") or {}
+        players.setdefault(player["puuid"].lower(), PlayerLine(
+            player.get("character"), player.get("character_id"), stats.get("kills"),
+            stats.get("deaths"), stats.get("assists"), str(player.get("team")).lower(),
+        ))
+    red = match["teams"].get("red") or {}
+    blue = match["teams"].get("blue") or {}
+    red_score, blue_score = red.get("rounds_won"), blue.get("rounds_won")
+    both = red_score is not None and blue_score is not None
+    teams = {
+        "red": (red_score > blue_score if both else None, red_score, blue_score),
+        "blue": (blue_score > red_score if both else None, blue_score, red_score),
+    }
+    return MatchRecord(_extract_match_id(meta), meta.get("map"), teams, players, side_teams=True)
+
+
+def _match_stored(match: dict) -> MatchRecord:
+    """stored-matches v1 : meta + stats du seul joueur demandé, teams {red: n, blue: n}."""
+    meta, stats = match["meta"], match["stats"]
+    character = stats.get("character") or {}
+    red, blue = match["teams"].get("red"), match["teams"].get("blue")
+    both = red is not None and blue is not None
+    teams = {
+        "red": (red > blue if both else None, red, blue),
+        "blue": (blue > red if both else None, blue, red),
+    }
+    player = PlayerLine(character.get("name"), character.get("id"), stats.get("kills"),
+                        stats.get("deaths"), stats.get("assists"), str(stats.get("team")).lower())
+    return MatchRecord(_extract_match_id(meta), (meta.get("map") or {}).get("name"), teams,
+                       {stats["puuid"].lower(): player}, side_teams=True)
+
+
+def _match_generic(match: dict) -> MatchRecord:
+    """Forme inconnue : on sonde toutes les variantes de clés."""
+    players: Dict[str, PlayerLine] = {}
+    raw_players = match.get("players")
+    if isinstance(raw_players, dict):
+        raw_players = raw_players.get("all_players") or []
+    for player in raw_players or []:
+        agent = player.get("agent")
+        if isinstance(agent, dict):
+            agent_name, agent_id = agent.get("name"), agent.get("id")
+        else:
+            agent_name, agent_id = player.get("character") or agent, player.get("character_id")
+        stats = player.get("stats") if isinstance(player.get("stats"), dict) else player
+        team = player.get("team_id") or player.get("team")
+        players.setdefault(str(player.get("puuid", "")).lower(), PlayerLine(
+            agent_name, agent_id, stats.get("kills"), stats.get("deaths"), stats.get("assists"),
+            str(team).lower(),
+        ))
+
+    teams: Dict[str, tuple] = {}
+    side_teams = False
+    raw_teams = match.get("teams")
+    if isinstance(raw_teams, list):
+        for team in raw_teams:
             team_id = team.get("team_id") or team.get("team")
             rounds = team.get("rounds") or {}
             if isinstance(rounds, dict):
-                r_won = rounds.get("won")
-                r_lost = rounds.get("lost")
+                r_won, r_lost = rounds.get("won"), rounds.get("lost")
             else:
-                r_won = team.get("rounds_won")
-                r_lost = team.get("rounds_lost")
-            if str(team_id).lower() == str(my_team).lower():
-                won = team.get("won")
-                rounds_won, rounds_lost = r_won, r_lost
-    elif isinstance(teams, dict):
-        red = teams.get("red") or {}
-        blue = teams.get("blue") or {}
+                r_won, r_lost = team.get("rounds_won"), team.get("rounds_lost")
+            teams[str(team_id).lower()] = (team.get("won"), r_won, r_lost)
+    elif isinstance(raw_teams, dict):
+        red = raw_teams.get("red") or {}
+        blue = raw_teams.get("blue") or {}
         red_score = red.get("rounds_won", red) if isinstance(red, dict) else red
         blue_score = blue.get("rounds_won", blue) if isinstance(blue, dict) else blue
         if isinstance(red_score, dict):
             red_score = red_score.get("won")
         if isinstance(blue_score, dict):
             blue_score = blue_score.get("won")
-        if str(my_team).lower() == "red":
-            rounds_won, rounds_lost = red_score, blue_score
-        else:
-            rounds_won, rounds_lost = blue_score, red_score
-        if rounds_won is not None and rounds_lost is not None:
-            won = rounds_won > rounds_lost
+        for side, r_won, r_lost in (("red", red_score, blue_score), ("blue", blue_score, red_score)):
+            won = r_won > r_lost if r_won is not None and r_lost is not None else None
+            teams[side] = (won, r_won, r_lost)
+        side_teams = True
+    return MatchRecord(_extract_match_id(match), _map_name_from_entry(match), teams, players, side_teams)
+
+
+MATCH_ADAPTERS = [
+    (lambda m: isinstance(m.get("players"), list) and "match_id" in (m.get("metadata") or {}), _match_v4),
+    (lambda m: isinstance(m.get("players"), dict) and isinstance(m.get("teams"), dict)
+     and "matchid" in (m.get("metadata") or {}), _match_v3),
+    (lambda m: isinstance(m.get("meta"), dict) and isinstance(m.get("stats"), dict), _match_stored),
+]
+
 
+def parse_matches(matches: list) -> List[MatchRecord]:
+    """Matchlist -> MatchRecord, joueurs indexés par puuid en un seul passage."""
+    matches = [match for match in matches if isinstance(match, dict)]
+    if not matches:
+        return []
+    adapter = _pick_adapter(matches[0], MATCH_ADAPTERS, _match_generic)
+    return _adapt_all(matches, adapter, _match_generic)
+
+
+def _find_match_details(records: Dict[str, MatchRecord], match_id: str, puuid: str) -> dict:
+    """Score, agent et KDA d'un joueur pour une partie, depuis le store des matchs."""
+    details: Dict[str, object] = {}
+    record = records.get(match_id)
+    if record is None:
+        return details
+
+    details["map_name"] = record.map_name
+    me = record.players.get(puuid.lower())
+    if me is None:
+        return details
+
+    details["agent_name"] = me.agent_name
+    details["agent_id"] = me.agent_id
+    details["kills"] = me.kills
+    details["deaths"] = me.deaths
+    details["assists"] = me.assists
+
+    team = record.teams.get(me.team)
+    if team is None and record.side_teams:
+        team = record.teams.get("blue")
+    won, rounds_won, rounds_lost = team or (None, None, None)
     details["rounds_won"] = rounds_won
     details["rounds_lost"] = rounds_lost
     details["won"] = won
     return details
 
 
+class MatchStore:
+    """Détails de match partagés par match_id (mémoire puis table `rr_matches`).
+
+    Quand plusieurs joueurs suivis jouent ensemble, le match n'est téléchargé
+    qu'une fois : les suivants le trouvent ici.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.memory = ByteLRU(max_bytes, sizeof=lambda item: item[1])
+        self.fetches_saved = 0
+
+    async def get_many(self, match_ids: List[str]) -> Dict[str, MatchRecord]:
+        found: Dict[str, MatchRecord] = {}
+        missing: List[str] = []
+        for match_id in match_ids:
+            item = self.memory.get(match_id)
+            if item is not None:
+                found[match_id] = item[0]
+            else:
+                missing.append(match_id)
+        if missing:
+            for match_id, payload in (await db.rr_matches_get(missing)).items():
+                try:
+                    record = MatchRecord.from_json(json_loads(payload))
+                except (ValueError, TypeError, AttributeError):
+                    continue  # ancien format : le match sera simplement retéléchargé
+                self.memory.put(match_id, (record, len(payload)))
+                found[match_id] = record
+        return found
+
+    async def put_many(self, records: List[MatchRecord]) -> None:
+        rows: List[Tuple[str, str]] = []
+        for record in records:
+            if not record.match_id:
+                continue
+            payload = json_dumps(record.to_json())
+            self.memory.put(record.match_id, (record, len(payload)))
+            rows.append((record.match_id, payload))
+        if rows:
+            await db.rr_matches_put(rows)
+
+    def stats(self) -> dict:
+        return {"fetches_saved": self.fetches_saved, "memory": self.memory.stats()}
+
+
+match_store = MatchStore(RR_MATCH_CACHE_BYTES)
+register_metrics("match_store", match_store.stats)
+
+
 def agent_icon_url(agent_id: Optional[str]) -> Optional[str]:
     if not agent_id:
         return None
@@ -1731,18 +3631,7 @@ def agent_icon_url(agent_id: Optional[str]) -> Optional[str]:
 # ===================== RR TRACKER : RÔLES DE RANG =====================
 def find_rank_role(guild: discord.Guild, rank_name: str) -> Optional[discord.Role]:
     """Retrouve le rôle d'un rang, même si son nom est décoré (ex: '👑・Immortal 2')."""
-    exact = discord.utils.get(guild.roles, name=rank_name)
-    if exact is not None:
-        return exact
-    wanted = slug(rank_name)
-    for role in guild.roles:
-        if slug(role.name) == wanted:
-            return role
-    # Rôle décoré, ex: "👑・Immortal 2" ou "『 Or 3 』"
-    for role in guild.roles:
-        if find_rank_role_name(role) == rank_name:
-            return role
-    return None
+    return role_registry.rank_role(guild, rank_name)
 
 
 async def ensure_rank_role(guild: discord.Guild, rank_name: str) -> Optional[discord.Role]:
@@ -1753,13 +3642,15 @@ async def ensure_rank_role(guild: discord.Guild, rank_name: str) -> Optional[dis
     tier = rank_name.split()[0]
     color = discord.Color(RANK_TIER_COLOR.get(tier, 0x99AAB5))
     try:
-        return await guild.create_role(
+        role = await guild.create_role(
             name=rank_name,
             color=color,
             hoist=False,
             mentionable=False,
             reason="Création automatique du rôle de rang",
         )
+        role_registry.refresh(guild)
+        return role
     except discord.Forbidden:
         print(f"[RR] Permissions insuffisantes pour créer le rôle {rank_name}")
         return None
@@ -1832,8 +3723,8 @@ async def ensure_rr_channel(guild: discord.Guild) -> Optional[discord.TextChanne
 
 
 # ===================== RR TRACKER : EMBEDS =====================
-def build_match_embed(guild: discord.Guild, row: sqlite3.Row, entry: dict, details: dict,
-                       rr_change: int, rr_after: Optional[int], tier_name: Optional[str]) -> discord.Embed:
+def _match_outcome(details: dict, rr_change: int) -> Tuple[str, discord.Color]:
+    """Titre (victoire / défaite / égalité avec score) et couleur d'une partie."""
     won = details.get("won")
     rounds_won = details.get("rounds_won")
     rounds_lost = details.get("rounds_lost")
@@ -1851,11 +3742,20 @@ def build_match_embed(guild: discord.Guild, row: sqlite3.Row, entry: dict, detai
     else:
         score = f" ({rounds_won}-{rounds_lost})" if rounds_won is not None else ""
         titre, couleur = f"Défaite{score}", discord.Color(0xE74C3C)
+    return titre, couleur
+
+
+def _rank_after_text(rr_after: Optional[int], tier_name: Optional[str]) -> str:
+    rang_txt = api_rank_to_fr(tier_name) or (tier_name or "Non classé")
+    return f"{rang_txt} {rr_after} RR" if rr_after is not None else rang_txt
+
 
+def build_match_embed(guild: discord.Guild, row: sqlite3.Row, entry: HistoryEntry, details: dict) -> discord.Embed:
+    rr_change = int(entry.rr_change)
+    titre, couleur = _match_outcome(details, rr_change)
     pseudo = row["riot_name"]
     verbe = "gagner" if rr_change >= 0 else "perdre"
-    rang_txt = api_rank_to_fr(tier_name) or (tier_name or "Non classé")
-    rr_txt = f"{rang_txt} {rr_after} RR" if rr_after is not None else rang_txt
+    rr_txt = _rank_after_text(entry.rr, entry.tier_name)
 
     embed = discord.Embed(
         title=titre,
@@ -1872,7 +3772,7 @@ def build_match_embed(guild: discord.Guild, row: sqlite3.Row, entry: dict, detai
     agent_name = details.get("agent_name")
     if agent_name:
         embed.add_field(name="Agent", value=str(agent_name), inline=True)
-    map_name = details.get("map_name") or _map_name_from_entry(entry)
+    map_name = details.get("map_name") or entry.map_name
     if map_name:
         embed.add_field(name="Map", value=str(map_name), inline=True)
 
@@ -1885,19 +3785,56 @@ def build_match_embed(guild: discord.Guild, row: sqlite3.Row, entry: dict, detai
         if member is not None:
             embed.set_footer(text=f"Compte lié à {member.display_name}")
 
-    played = _parse_match_date(entry)
-    embed.timestamp = played or datetime.now(timezone.utc)
+    embed.timestamp = entry.played_at or datetime.now(timezone.utc)
+    return embed
+
+
+def build_lobby_embed(guild: discord.Guild, results: List["LobbyResult"]) -> discord.Embed:
+    """Un seul message pour plusieurs joueurs suivis dans la même partie."""
+    results = sorted(results, key=lambda result: result.entry.rr_change, reverse=True)
+    outcomes = [_match_outcome(result.details, int(result.entry.rr_change)) for result in results]
+    if len({titre for titre, _ in outcomes}) == 1:
+        titre, couleur = outcomes[0]
+    else:  # joueurs suivis dans les deux équipes
+        titre, couleur = "Partie en commun", discord.Color(0x3498DB)
+
+    embed = discord.Embed(title=titre, color=couleur)
+    embed.set_author(name="Résultat du lobby", icon_url=guild.icon.url if guild.icon else None)
+
+    lignes: List[str] = []
+    for result, (resultat, _) in zip(results, outcomes):
+        details, entry = result.details, result.entry
+        signe = "+" if entry.rr_change >= 0 else "-"
+        ligne = (
+            f"**{result.row['riot_name']}** — {signe}{abs(int(entry.rr_change))} RR "
+            f"({_rank_after_text(entry.rr, entry.tier_name)})"
+        )
+        infos = [str(details["agent_name"])] if details.get("agent_name") else []
+        if details.get("kills") is not None:
+            infos.append(f"{details.get('kills')}/{details.get('deaths')}/{details.get('assists')}")
+        if titre == "Partie en commun":
+            infos.append(resultat)
+        if infos:
+            ligne += "\n" + " · ".join(infos)
+        lignes.append(ligne)
+    embed.description = "\n\n".join(lignes)
+
+    first = results[0]
+    map_name = first.details.get("map_name") or first.entry.map_name
+    if map_name:
+        embed.add_field(name="Map", value=str(map_name), inline=True)
+    embed.timestamp = first.entry.played_at or datetime.now(timezone.utc)
     return embed
 
 
 def build_leaderboard_embed(guild: discord.Guild, rows: List[sqlite3.Row], page: int, pages: int) -> discord.Embed:
+    """Une page du classement ; `rows` ne contient que les lignes de cette page."""
     embed = discord.Embed(title="Classement des joueurs", color=discord.Color(0xFF69B4))
     if guild.icon:
         embed.set_author(name="Classement des joueurs", icon_url=guild.icon.url)
 
-    start = page * RR_PAGE_SIZE
     lignes: List[str] = []
-    for index, row in enumerate(rows[start:start + RR_PAGE_SIZE], start=start + 1):
+    for index, row in enumerate(rows, start=page * RR_PAGE_SIZE + 1):
         medal = MEDALS.get(index, "")
         prefix = f"{medal} **{index}er**" if index == 1 else f"{medal} **{index}ème**" if medal else f"**{index}ème**"
         rang = rank_display(row["current_tier_name"], row["current_rr"])
@@ -1943,13 +3880,101 @@ def build_daily_embed(guild: discord.Guild, stats: List[dict], jour_label: str)
     return embed
 
 
+# COLLATE NOCASE de SQLite : seules les lettres ASCII sont repliées.
+_SQLITE_NOCASE = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+
+def _ranking_key(sort_key: int, riot_name: str, puuid: str) -> Tuple[int, str, str]:
+    """Clé croissante dans l'ordre exact du classement SQL (sort_key DESC, nom NOCASE, puuid)."""
+    return -sort_key, riot_name.translate(_SQLITE_NOCASE), puuid
+
+
+class LeaderboardPages:
+    """Pages du /leaderboard rendues une fois par serveur et partagées par toutes les vues.
+
+    Chaque page est lue par keyset à partir de la dernière ligne de la précédente ;
+    le cache d'un serveur n'est vidé que lorsqu'un classement change (rr_update_state,
+    pseudo, ajout ou retrait d'un compte). La position d'un joueur (/rr_stats) se lit
+    par bisection dans la liste triée des clés du serveur. Un résultat lu pendant
+    qu'une invalidation passe (génération changée) est servi une fois mais pas gardé.
+    """
+
+    def __init__(self):
+        # guild_id -> page -> (embed, clé keyset de la dernière ligne)
+        self._pages: Dict[int, Dict[int, Tuple[discord.Embed, Optional[Tuple[int, str, str]]]]] = {}
+        self._totals: Dict[int, int] = {}
+        self._ranks: Dict[int, List[Tuple[int, str, str]]] = {}
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self._generations: Dict[int, int] = {}
+        self.hits = 0
+        self.renders = 0
+        self.invalidations = 0
+
+    def invalidate(self, guild_id: int) -> None:
+        self._generations[guild_id] = self._generations.get(guild_id, 0) + 1  # même sans cache : requête en vol
+        cached = self._pages.pop(guild_id, None)
+        self._totals.pop(guild_id, None)
+        ranks = self._ranks.pop(guild_id, None)
+        if cached or ranks:
+            self.invalidations += 1
+
+    async def position(self, guild_id: int, row) -> Tuple[int, int]:
+        """(place du joueur, nombre de joueurs classés) ; O(log n) une fois la liste chargée."""
+        ranks = self._ranks.get(guild_id)
+        if ranks is None:
+            generation = self._generations.get(guild_id, 0)
+            ranks = [_ranking_key(*entry) for entry in await db.rr_leaderboard(guild_id)]
+            if self._generations.get(guild_id, 0) == generation:
+                self._ranks[guild_id] = ranks
+        return bisect.bisect_left(ranks, _ranking_key(row["sort_key"], row["riot_name"], row["puuid"])) + 1, len(ranks)
+
+    async def get(self, guild: discord.Guild, page: int) -> Tuple[discord.Embed, int]:
+        """Renvoie (embed de la page, nombre de pages) ; la page est bornée au classement actuel."""
+        async with self._locks.setdefault(guild.id, asyncio.Lock()):  # un seul rendu pour les vues simultanées
+            generation = self._generations.get(guild.id, 0)
+            total = self._totals.get(guild.id)
+            if total is None:
+                total = await db.rr_count_players(guild.id)
+            pages = max(1, math.ceil(total / RR_PAGE_SIZE))
+            page = min(max(page, 0), pages - 1)
+            cache = self._pages.get(guild.id, {})
+            if page in cache:
+                self.hits += 1
+                return cache[page][0], pages
+            # Les pages précédentes manquantes sont rendues au passage : elles donnent le curseur.
+            start = max([known for known in cache if known < page], default=-1) + 1
+            for current in range(start, page + 1):
+                after = cache[current - 1][1] if current > 0 else None
+                rows = await db.rr_leaderboard_page(guild.id, after, RR_PAGE_SIZE)
+                last = (rows[-1]["sort_key"], rows[-1]["riot_name"], rows[-1]["puuid"]) if rows else after
+                cache[current] = (build_leaderboard_embed(guild, rows, current, pages), last)
+                self.renders += 1
+            if self._generations.get(guild.id, 0) == generation:
+                self._totals[guild.id] = total
+                self._pages[guild.id] = cache
+            return cache[page][0], pages
+
+    def stats(self) -> dict:
+        return {
+            "guilds": len(self._pages),
+            "pages": sum(len(pages) for pages in self._pages.values()),
+            "ranked_guilds": len(self._ranks),
+            "hits": self.hits,
+            "renders": self.renders,
+            "invalidations": self.invalidations,
+        }
+
+
+leaderboard_pages = LeaderboardPages()
+register_metrics("leaderboard_pages", leaderboard_pages.stats)
+
+
 class LeaderboardView(discord.ui.View):
-    def __init__(self, guild: discord.Guild, rows: List[sqlite3.Row], page: int = 0):
+    def __init__(self, guild: discord.Guild, pages: int, page: int = 0):
         super().__init__(timeout=180)
         self.guild = guild
-        self.rows = rows
         self.page = page
-        self.pages = max(1, math.ceil(len(rows) / RR_PAGE_SIZE))
+        self.pages = pages
         self._refresh_buttons()
 
     def _refresh_buttons(self) -> None:
@@ -1957,11 +3982,10 @@ class LeaderboardView(discord.ui.View):
         self.next_page.disabled = self.page >= self.pages - 1
 
     async def _update(self, interaction: discord.Interaction) -> None:
+        embed, self.pages = await leaderboard_pages.get(self.guild, self.page)
+        self.page = min(self.page, self.pages - 1)
         self._refresh_buttons()
-        await interaction.response.edit_message(
-            embed=build_leaderboard_embed(self.guild, self.rows, self.page, self.pages),
-            view=self,
-        )
+        await interaction.response.edit_message(embed=embed, view=self)
 
     @discord.ui.button(label="◀", style=discord.ButtonStyle.secondary)
     async def previous_page(self, interaction: discord.Interaction, _: discord.ui.Button) -> None:
@@ -1988,138 +4012,606 @@ def _start_of_today_utc_iso() -> str:
     return start.astimezone(timezone.utc).isoformat()
 
 
-async def process_player(guild: discord.Guild, row: sqlite3.Row,
-                          channel: Optional[discord.TextChannel]) -> None:
+def _state_changed(row, tier_id, tier_name, rr, elo, match_id) -> bool:
+    """Vrai si `rr_update_state` modifierait réellement la ligne (les None sont ignorés)."""
+    wanted = {
+        "current_tier_id": tier_id,
+        "current_tier_name": tier_name,
+        "current_rr": rr,
+        "elo": elo,
+        "last_match_id": match_id,
+    }
+    return any(value is not None and row[column] != value for column, value in wanted.items())
+
+
+@dataclass
+class RRTarget:
+    """Serveur abonné à un compte : où annoncer, et à quel membre le compte est lié."""
+    guild: discord.Guild
+    channel: Optional[discord.TextChannel]
+    discord_id: Optional[int]
+
+
+@dataclass
+class LobbyResult:
+    """Une partie classée d'un joueur suivi, en attente d'annonce."""
+    row: dict
+    entry: HistoryEntry
+    details: dict
+
+
+class AnnouncementQueue:
+    """File d'envoi par salon pour les annonces du tracker.
+
+    Le suivi ne fait qu'empiler : un worker par salon regroupe jusqu'à 10 embeds
+    par message (limite Discord, 6000 caractères au total) et envoie dès que le
+    lot est plein ou après `interval`. Les 429 sont gérés ici : le lot est remis
+    en tête et le salon est mis en pause le temps demandé par Discord.
+    """
+
+    MAX_EMBEDS = 10
+    MAX_CHARS = 6000
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._queues: Dict[int, deque] = {}
+        self._channels: Dict[int, discord.abc.Messageable] = {}
+        self._full: Dict[int, asyncio.Event] = {}
+        self._workers: Dict[int, asyncio.Task] = {}
+        self.messages = 0
+        self.embeds = 0
+        self.rate_limited = 0
+        self.dropped = 0
+
+    def enqueue(self, channel: discord.abc.Messageable, *, embed: Optional[discord.Embed] = None,
+                content: Optional[str] = None) -> None:
+        queue = self._queues.setdefault(channel.id, deque())
+        self._channels[channel.id] = channel
+        queue.append(embed if embed is not None else content)
+        full = self._full.setdefault(channel.id, asyncio.Event())
+        if sum(1 for item in queue if isinstance(item, discord.Embed)) >= self.MAX_EMBEDS:
+            full.set()
+        worker = self._workers.get(channel.id)
+        if worker is None or worker.done():
+            self._workers[channel.id] = asyncio.create_task(self._worker(channel.id))
+
+    def _take(self, queue: deque) -> Union[str, List[discord.Embed]]:
+        """Prochain message : un texte seul, ou un lot d'embeds consécutifs."""
+        if not isinstance(queue[0], discord.Embed):
+            return queue.popleft()
+        batch: List[discord.Embed] = []
+        chars = 0
+        while queue and isinstance(queue[0], discord.Embed) and len(batch) < self.MAX_EMBEDS:
+            if batch and chars + len(queue[0]) > self.MAX_CHARS:
+                break
+            chars += len(queue[0])
+            batch.append(queue.popleft())
+        return batch
+
+    async def _worker(self, channel_id: int) -> None:
+        queue = self._queues[channel_id]
+        full = self._full[channel_id]
+        while queue:
+            try:
+                await asyncio.wait_for(full.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            full.clear()
+            while queue:
+                item = self._take(queue)
+                delay = await self._send(self._channels[channel_id], item)
+                if delay is None:
+                    continue
+                if delay < 0:  # salon inaccessible : inutile d'insister
+                    self.dropped += len(queue) + 1
+                    queue.clear()
+                    break
+                for element in reversed(item if isinstance(item, list) else [item]):
+                    queue.appendleft(element)
+                await asyncio.sleep(delay)
+        self._workers.pop(channel_id, None)
+
+    async def _send(self, channel: discord.abc.Messageable, item: Union[str, List[discord.Embed]]) -> Optional[float]:
+        """Envoie un message ; renvoie None si c'est fait, -1 pour abandonner, sinon l'attente avant de réessayer."""
+        try:
+            if isinstance(item, list):
+                await channel.send(embeds=item)
+                self.embeds += len(item)
+            else:
+                await channel.send(item)
+            self.messages += 1
+            return None
+        except (discord.Forbidden, discord.NotFound) as exc:
+            print(f"[RR] Salon d'annonce inaccessible ({channel.id}) : {exc}")
+            return -1.0
+        except discord.HTTPException as exc:
+            if exc.status == 429:
+                self.rate_limited += 1
+                retry_after = getattr(exc, "retry_after", None)
+                if retry_after is None and exc.response is not None:
+                    retry_after = float(exc.response.headers.get("Retry-After", 5))
+                return max(1.0, float(retry_after or 5))
+            print(f"[RR] Envoi du résultat impossible : {exc}")
+            self.dropped += len(item) if isinstance(item, list) else 1
+            return None
+
+    def stats(self) -> dict:
+        return {
+            "messages": self.messages,
+            "embeds": self.embeds,
+            "queued": sum(len(queue) for queue in self._queues.values()),
+            "rate_limited": self.rate_limited,
+            "dropped": self.dropped,
+        }
+
+
+rr_announcements = AnnouncementQueue(RR_ANNOUNCE_INTERVAL)
+register_metrics("rr_announcements", rr_announcements.stats)
+
+
+class LobbyBuffer:
+    """Annonces d'un cycle de suivi, regroupées par (serveur, partie).
+
+    Les joueurs suivis d'un même lobby partagent un seul message au lieu d'un
+    message chacun ; une partie avec un seul joueur suivi garde l'embed habituel.
+    """
+
+    def __init__(self):
+        self._groups: Dict[Tuple[int, str], List[LobbyResult]] = {}
+        self._targets: Dict[Tuple[int, str], RRTarget] = {}
+        self.sent = 0
+        self.grouped = 0
+
+    def add(self, target: RRTarget, match_id: str, result: LobbyResult) -> None:
+        key = (target.guild.id, match_id)
+        self._targets.setdefault(key, target)
+        self._groups.setdefault(key, []).append(result)
+
+    async def teammates(self, tracked: Set[str], done: Set[str]) -> Set[str]:
+        """Comptes suivis présents dans les parties du cycle mais pas encore traités."""
+        match_ids = list({match_id for _, match_id in self._groups})
+        if not match_ids:
+            return set()
+        by_lower = {puuid.lower(): puuid for puuid in tracked if puuid not in done}
+        found: Set[str] = set()
+        for record in (await match_store.get_many(match_ids)).values():
+            found.update(by_lower[p] for p in record.players if p in by_lower)
+        return found
+
+    def flush(self) -> None:
+        """Confie les annonces du cycle à la file d'envoi (aucune attente sur Discord)."""
+        def played(key: Tuple[int, str]) -> datetime:
+            return self._groups[key][0].entry.played_at or datetime.now(timezone.utc)
+
+        for key in sorted(self._groups, key=played):  # de la plus ancienne à la plus récente
+            target, results = self._targets[key], self._groups[key]
+            if len(results) == 1:
+                result = results[0]
+                embed = build_match_embed(target.guild, result.row, result.entry, result.details)
+            else:
+                embed = build_lobby_embed(target.guild, results)
+                self.grouped += len(results) - 1
+            rr_announcements.enqueue(target.channel, embed=embed)
+            self.sent += 1
+        self._groups.clear()
+        self._targets.clear()
+
+
+_player_locks: Dict[str, asyncio.Lock] = {}
+
+
+async def process_player(row: sqlite3.Row, targets: List[RRTarget], lobby: LobbyBuffer) -> bool:
+    """Traite un compte une fois et confie ses résultats au regroupement par lobby.
+
+    Renvoie True s'il a joué de nouvelles parties. Un compte déjà en cours de
+    traitement (boucle et /rr_refresh en même temps) n'est pas traité une seconde fois.
+    """
+    lock = _player_locks.setdefault(row["puuid"], asyncio.Lock())
+    if lock.locked():
+        return False
+    async with lock:
+        return await _process_player(row, targets, lobby)
+
+
+async def _process_player(row: sqlite3.Row, targets: List[RRTarget], lobby: LobbyBuffer) -> bool:
     puuid = row["puuid"]
     region = row["region"] or RR_DEFAULT_REGION
     platform = row["platform"] or RR_DEFAULT_PLATFORM
+    # Toutes les écritures d'un passage joueur partent dans un seul commit.
+    uow = db.unit_of_work()
 
     try:
         history_data = await valo_api.get_mmr_history(region, puuid, platform)
     except ValorantAPIError as exc:
         print(f"[RR] {row['riot_name']}#{row['riot_tag']} : {exc}")
-        return
+        return False
 
     # Mise à jour automatique du pseudo Riot en cas de changement.
     account = history_data.get("account") or {}
     new_name = account.get("name")
     new_tag = account.get("tag")
+    renamed_from = None
     if new_name and new_tag and (new_name != row["riot_name"] or new_tag != row["riot_tag"]):
-        db.rr_update_identity(puuid, new_name, new_tag)
-        if channel is not None:
-            try:
-                await channel.send(
-                    f"🔄 **{row['riot_name']}#{row['riot_tag']}** a changé de pseudo Riot "
-                    f"→ **{new_name}#{new_tag}**. Le suivi est à jour."
-                )
-            except discord.HTTPException:
-                pass
-        row = db.rr_get_player(puuid) or row
+        uow.rr_update_identity(puuid, new_name, new_tag)
+        renamed_from = f"{row['riot_name']}#{row['riot_tag']}"
+        row = dict(row)
+        row.update(riot_name=new_name, riot_tag=new_tag)
 
     history = history_data.get("history") or history_data.get("data") or []
-    if not isinstance(history, list) or not history:
-        return
+    history = parse_history(history) if isinstance(history, list) else []
+    if not history:
+        await uow.commit()
+        _ranking_changed(targets, renamed_from is not None)
+        _announce_rename(targets, renamed_from, new_name, new_tag)
+        return False
 
     last_known = row["last_match_id"]
-    nouvelles: List[dict] = []
+    nouvelles: List[HistoryEntry] = []
     for entry in history:
-        match_id = _extract_match_id(entry)
-        if not match_id:
+        if not entry.match_id:
             continue
-        if last_known and match_id == last_known:
+        if last_known and entry.match_id == last_known:
             break
         nouvelles.append(entry)
 
     latest = history[0]
-    latest_tier_id, latest_tier_name = _tier_from_entry(latest)
-    latest_rr, _ = _rr_from_entry(latest)
-    latest_match_id = _extract_match_id(latest)
 
     # Premier passage : on enregistre l'état sans spammer l'historique.
-    if not last_known:
-        db.rr_update_state(puuid, latest_tier_id, latest_tier_name, latest_rr,
-                           latest.get("elo"), latest_match_id)
-        return
-
-    if not nouvelles:
-        db.rr_update_state(puuid, latest_tier_id, latest_tier_name, latest_rr,
-                           latest.get("elo"), last_known)
-        return
+    # Sans nouvelle partie, on n'écrit que si l'état a réellement changé.
+    if not last_known or not nouvelles:
+        if not last_known:
+            uow.rr_backfill_start(puuid)  # l'historique antérieur est repris en tâche de fond
+        state_match_id = latest.match_id if not last_known else last_known
+        state = None
+        if _state_changed(row, latest.tier_id, latest.tier_name, latest.rr, latest.elo, state_match_id):
+            state = uow.rr_update_state(puuid, latest.tier_id, latest.tier_name, latest.rr,
+                                        latest.elo, state_match_id)
+        results = await uow.commit()
+        _ranking_changed(targets, renamed_from is not None or (state is not None and results[state]))
+        _announce_rename(targets, renamed_from, new_name, new_tag)
+        return False
 
-    # On récupère les détails (agent, KDA, score) une seule fois pour toutes les nouvelles games.
-    matches: List[dict] = []
-    try:
-        matches = await valo_api.get_matches(region, puuid, platform, size=max(5, len(nouvelles)))
-    except ValorantAPIError as exc:
-        print(f"[RR] Détails de match indisponibles pour {row['riot_name']} : {exc}")
+    # Détails (agent, KDA, score) : d'abord le store partagé, sinon une seule matchlist
+    # pour toutes les nouvelles games (elle sert aussi aux coéquipiers suivis).
+    wanted = [entry.match_id for entry in nouvelles]
+    records = await match_store.get_many(wanted)
+    if len(records) < len(wanted):
+        try:
+            matches = await valo_api.get_matches(region, puuid, platform, size=max(5, len(nouvelles)))
+        except ValorantAPIError as exc:
+            print(f"[RR] Détails de match indisponibles pour {row['riot_name']} : {exc}")
+        else:
+            parsed = parse_matches(matches)
+            await match_store.put_many(parsed)
+            records.update((record.match_id, record) for record in parsed if record.match_id)
+    else:
+        match_store.fetches_saved += 1
 
+    pending: List[Tuple[int, HistoryEntry, dict]] = []
     for entry in reversed(nouvelles):  # de la plus ancienne à la plus récente
-        match_id = _extract_match_id(entry)
-        rr_after, rr_change = _rr_from_entry(entry)
-        if rr_change is None:
+        if entry.rr_change is None:
             continue
-        tier_id, tier_name = _tier_from_entry(entry)
-        details = _find_match_details(matches, match_id, puuid)
+        details = _find_match_details(records, entry.match_id, puuid)
 
-        inserted = db.rr_add_history(
+        index = uow.rr_add_history(
             puuid=puuid,
-            guild_id=guild.id,
-            match_id=match_id,
-            rr_change=int(rr_change),
-            rr_after=rr_after,
-            tier_name=tier_name,
-            map_name=details.get("map_name") or _map_name_from_entry(entry),
+            match_id=entry.match_id,
+            rr_change=int(entry.rr_change),
+            rr_after=entry.rr,
+            tier_name=entry.tier_name,
+            map_name=details.get("map_name") or entry.map_name,
             agent=details.get("agent_name"),
             kills=details.get("kills"),
             deaths=details.get("deaths"),
             assists=details.get("assists"),
             rounds_won=details.get("rounds_won"),
             rounds_lost=details.get("rounds_lost"),
-            played_at=(_parse_match_date(entry) or datetime.now(timezone.utc)).isoformat(),
+            played_at=(entry.played_at or datetime.now(timezone.utc)).isoformat(),
         )
-        if not inserted:
-            continue  # déjà annoncé
-
-        if channel is not None:
-            try:
-                await channel.send(embed=build_match_embed(
-                    guild, row, entry, details, int(rr_change), rr_after, tier_name
-                ))
-            except discord.HTTPException as exc:
-                print(f"[RR] Envoi du résultat impossible : {exc}")
-        await asyncio.sleep(1)
+        pending.append((index, entry, details))
+
+    state = uow.rr_update_state(puuid, latest.tier_id, latest.tier_name, latest.rr,
+                                latest.elo, latest.match_id)
+    results = await uow.commit()
+    _ranking_changed(targets, renamed_from is not None or results[state])
+    _announce_rename(targets, renamed_from, new_name, new_tag)
+
+    announced = [item for item in pending if results[item[0]]]  # les autres sont déjà annoncées
+    for target in targets:
+        target_row = dict(row, guild_id=target.guild.id, discord_id=target.discord_id)
+        if target.channel is not None:
+            for _, entry, details in announced:
+                lobby.add(target, entry.match_id, LobbyResult(target_row, entry, details))
+
+        # Synchronisation du rôle de rang si le compte est lié à un membre Discord.
+        if target.discord_id:
+            member = target.guild.get_member(int(target.discord_id))
+            if member is not None:
+                try:
+                    await sync_rank_role_from_api(member, latest.tier_name)
+                except discord.HTTPException:
+                    pass
+    return True
 
-    db.rr_update_state(puuid, latest_tier_id, latest_tier_name, latest_rr,
-                       latest.get("elo"), latest_match_id)
 
-    # Synchronisation du rôle de rang si le compte est lié à un membre Discord.
-    if row["discord_id"]:
-        member = guild.get_member(int(row["discord_id"]))
-        if member is not None:
-            try:
-                await sync_rank_role_from_api(member, latest_tier_name)
-            except discord.HTTPException:
-                pass
+def _ranking_changed(targets: List[RRTarget], changed: bool) -> None:
+    """Vide les pages de classement en cache des serveurs qui suivent ce compte."""
+    if changed:
+        for target in targets:
+            leaderboard_pages.invalidate(target.guild.id)
 
 
-@tasks.loop(seconds=RR_POLL_INTERVAL)
-async def rr_tracker_loop() -> None:
-    await bot.wait_until_ready()
-    if not HENRIK_API_KEY:
+def _announce_rename(targets: List[RRTarget], old_riot_id: Optional[str],
+                      new_name: Optional[str], new_tag: Optional[str]) -> None:
+    if old_riot_id is None:
         return
-    for guild in bot.guilds:
-        players = db.rr_list_players(guild.id)
-        if not players:
+    for target in targets:
+        if target.channel is None:
             continue
-        channel = get_rr_channel(guild)
-        if channel is None:
-            channel = await ensure_rr_channel(guild)
-        for row in players:
+        rr_announcements.enqueue(
+            target.channel,
+            content=f"🔄 **{old_riot_id}** a changé de pseudo Riot "
+                    f"→ **{new_name}#{new_tag}**. Le suivi est à jour.",
+        )
+
+
+class RRPollScheduler:
+    """Échéancier des joueurs (tas par puuid) et exécution en parallèle bornée.
+
+    Chaque compte a sa propre échéance : retour à RR_POLL_INTERVAL dès qu'une
+    nouvelle partie apparaît, puis intervalle doublé à chaque passage à vide
+    jusqu'à RR_POLL_MAX_INTERVAL. Le rythme réel des appels reste donné par le
+    seau à jetons de l'API.
+    """
+
+    def __init__(self, concurrency: int, min_interval: float, max_interval: float):
+        self.concurrency = max(1, concurrency)
+        self.min_interval = float(min_interval)
+        self.max_interval = float(max(min_interval, max_interval))
+        self._heap: List[Tuple[float, int, str]] = []
+        self._plan: Dict[str, Tuple[float, float]] = {}  # puuid -> (échéance, intervalle)
+        self._seq = count()
+        self.cycles = 0
+        self.last_cycle_players = 0
+        self.last_cycle_s = 0.0
+        self.announcements = 0
+        self.grouped_announcements = 0
+        self._urgent: deque = deque()  # demandés par /rr_refresh, passent avant l'échéancier
+        self._in_flight: Set[str] = set()
+        self._watchers: List["RefreshProgress"] = []
+
+    def _schedule(self, puuid: str, due: float, interval: float) -> None:
+        self._plan[puuid] = (due, interval)
+        heapq.heappush(self._heap, (due, next(self._seq), puuid))
+
+    async def sync(self, puuids: List[str]) -> None:
+        """Ajoute les nouveaux comptes (dus tout de suite) et oublie ceux qui ne sont plus suivis."""
+        wanted = set(puuids)
+        for puuid in [p for p in self._plan if p not in wanted]:
+            del self._plan[puuid]  # l'entrée du tas devient obsolète
+        new = [puuid for puuid in puuids if puuid not in self._plan]
+        if not new:
+            return
+        last_played = await db.rr_last_played(new)
+        now = time.monotonic()
+        for puuid in new:
+            played = _parse_match_date({"date": last_played.get(puuid)})
+            recent = played is not None and datetime.now(timezone.utc) - played < RR_ACTIVE_WINDOW
+            self._schedule(puuid, now, self.min_interval if recent else self.max_interval)
+
+    def enqueue_front(self, puuids: List[str]) -> int:
+        """Met des comptes en tête de file ; ignore ceux déjà demandés ou en cours. Renvoie le nombre ajouté."""
+        queued = set(self._urgent)
+        added = 0
+        for puuid in puuids:
+            if puuid in queued or puuid in self._in_flight:
+                continue
+            self._urgent.append(puuid)
+            queued.add(puuid)
+            added += 1
+        return added
+
+    def watch(self, progress: "RefreshProgress") -> None:
+        self._watchers.append(progress)
+
+    def settle(self, puuid: str, ok: bool = True) -> None:
+        """Signale un compte traité (ou abandonné) aux /rr_refresh qui l'attendent."""
+        for watcher in self._watchers:
+            watcher.done(puuid, ok)
+        self._watchers = [watcher for watcher in self._watchers if not watcher.finished]
+
+    def pop_due(self) -> List[str]:
+        """Comptes à traiter : demandes urgentes d'abord, puis échéances dépassées."""
+        due = list(self._urgent)
+        self._urgent.clear()
+        seen = set(due)
+        now = time.monotonic()
+        while self._heap and self._heap[0][0] <= now:
+            at, _, puuid = heapq.heappop(self._heap)
+            plan = self._plan.get(puuid)
+            if plan is not None and plan[0] == at and puuid not in seen:
+                due.append(puuid)
+                seen.add(puuid)
+        return due
+
+    def reschedule(self, puuid: str, active: bool) -> None:
+        if puuid not in self._plan:
+            return
+        if valo_api.breaker.is_open():
+            # Passage perdu à cause de l'API : on réessaie à la réouverture, sans pénaliser le compte.
+            self._schedule(puuid, time.monotonic() + valo_api.breaker.retry_in(), self._plan[puuid][1])
+            return
+        interval = self.min_interval if active else min(self.max_interval, self._plan[puuid][1] * 2)
+        self._schedule(puuid, time.monotonic() + interval, interval)
+
+    async def _run(self, semaphore: asyncio.Semaphore, lobby: LobbyBuffer,
+                   row: sqlite3.Row, targets: List[RRTarget], teammate: bool = False) -> bool:
+        async with semaphore:
+            active = ok = False
+            self._in_flight.add(row["puuid"])
             try:
-                await process_player(guild, row, channel)
+                active = await process_player(row, targets, lobby)
+                ok = True
+                return True
             except Exception as exc:  # on ne casse jamais la boucle
                 print(f"[RR] Erreur inattendue sur {row['riot_name']} : {exc}")
-            await asyncio.sleep(1.5)
+                return False
+            finally:
+                self._in_flight.discard(row["puuid"])
+                # Un coéquipier vient de jouer même si son historique n'a pas encore la
+                # partie : il reste au rythme rapide pour que ses RR arrivent vite.
+                self.reschedule(row["puuid"], bool(active) or teammate)
+                self.settle(row["puuid"], ok)
+
+    async def run_cycle(self, jobs: List[Tuple[sqlite3.Row, List[RRTarget]]]) -> int:
+        """Traite les joueurs donnés ; renvoie le nombre de comptes en erreur.
+
+        Les coéquipiers suivis repérés dans les nouvelles parties sont traités dans
+        la foulée, pour que tout le lobby parte dans un seul message.
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        lobby = LobbyBuffer()
+        started = time.monotonic()
+        results = await asyncio.gather(*(self._run(semaphore, lobby, *job) for job in jobs))
+        mates = await lobby.teammates(set(self._plan), {row["puuid"] for row, _ in jobs})
+        if mates:
+            extra = await rr_poll_jobs(mates)
+            results += await asyncio.gather(*(self._run(semaphore, lobby, *job, teammate=True) for job in extra))
+            jobs = list(jobs) + extra
+        lobby.flush()
+        self.announcements += lobby.sent
+        self.grouped_announcements += lobby.grouped
+        if jobs:
+            self.cycles += 1
+            self.last_cycle_players = len(jobs)
+            self.last_cycle_s = time.monotonic() - started
+        return results.count(False)
+
+    def stats(self) -> dict:
+        intervals = [interval for _, interval in self._plan.values()]
+        return {
+            "concurrency": self.concurrency,
+            "tracked": len(self._plan),
+            "active": sum(1 for interval in intervals if interval <= self.min_interval),
+            "avg_interval_s": round(sum(intervals) / len(intervals), 1) if intervals else 0.0,
+            "cycles": self.cycles,
+            "last_cycle_players": self.last_cycle_players,
+            "last_cycle_s": round(self.last_cycle_s, 2),
+            "announcements": self.announcements,
+            "grouped_announcements": self.grouped_announcements,
+            "urgent": len(self._urgent),
+            "in_flight": len(self._in_flight),
+        }
+
+
+rr_scheduler = RRPollScheduler(RR_POLL_CONCURRENCY, RR_POLL_INTERVAL, RR_POLL_MAX_INTERVAL)
+register_metrics("rr_scheduler", rr_scheduler.stats)
+
+
+async def rr_poll_jobs(puuids: Iterable[str]) -> List[Tuple[sqlite3.Row, List[RRTarget]]]:
+    """Un passage par compte (dans l'ordre demandé), avec les serveurs abonnés à prévenir."""
+    puuids = list(puuids)
+    wanted = set(puuids)
+    channels: Dict[int, Optional[discord.TextChannel]] = {}
+    targets: Dict[str, List[RRTarget]] = {}
+    for guild_id, puuid, discord_id in await db.rr_all_subscriptions():
+        if puuid not in wanted:
+            continue
+        guild = bot.get_guild(guild_id)
+        if guild is None:
+            continue
+        if guild_id not in channels:
+            channels[guild_id] = get_rr_channel(guild) or await ensure_rr_channel(guild)
+        targets.setdefault(puuid, []).append(RRTarget(guild, channels[guild_id], discord_id))
+    if not targets:
+        return []
+    rows = {row["puuid"]: row for row in await db.rr_tracked_accounts() if row["puuid"] in targets}
+    return [(rows[puuid], targets[puuid]) for puuid in puuids if puuid in rows]
+
+
+class RefreshProgress:
+    """Avancement d'un /rr_refresh : la réponse éphémère est éditée par lots, pas à chaque compte."""
+
+    EDIT_INTERVAL = 3.0
+
+    def __init__(self, interaction: discord.Interaction, puuids: Set[str]):
+        self.interaction = interaction
+        self.total = len(puuids)
+        self.pending = set(puuids)
+        self.errors = 0
+        self._last_edit = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def finished(self) -> bool:
+        return not self.pending
+
+    def text(self) -> str:
+        if self.finished:
+            texte = f"✅ Vérification terminée pour {self.total} joueur(s)."
+            if self.errors:
+                texte += f"\n⚠️ {self.errors} compte(s) en erreur (voir les logs)."
+            return texte
+        return f"🔄 Vérification en cours : {self.total - len(self.pending)}/{self.total} joueur(s)…"
+
+    def done(self, puuid: str, ok: bool) -> None:
+        if puuid not in self.pending:
+            return
+        self.pending.discard(puuid)
+        if not ok:
+            self.errors += 1
+        if self._task is None:
+            self._task = asyncio.create_task(self._edit_later(self._delay()))
+            _refresh_tasks.add(self._task)
+            self._task.add_done_callback(_refresh_tasks.discard)
+
+    def _delay(self) -> float:
+        return 0.0 if self.finished else max(0.0, self._last_edit + self.EDIT_INTERVAL - time.monotonic())
+
+    async def _edit_later(self, delay: float) -> None:
+        """Une seule tâche d'édition à la fois : les PATCH partent dans l'ordre et le dernier
+        envoyé est toujours le texte courant (jamais un « en cours » après « terminée »)."""
+        try:
+            while True:
+                if delay:
+                    await asyncio.sleep(delay)
+                sent = self.text()
+                self._last_edit = time.monotonic()
+                try:
+                    await self.interaction.edit_original_response(content=sent)
+                except discord.HTTPException:
+                    pass  # réponse expirée ou supprimée : le traitement continue quand même
+                if self.text() == sent:
+                    return
+                delay = self._delay()
+        finally:
+            self._task = None
+
+
+_tracker_tick_lock = asyncio.Lock()
+_refresh_tasks: Set[asyncio.Task] = set()
+
+
+async def run_tracker_tick() -> None:
+    """Un passage de l'échéancier ; la boucle et /rr_refresh ne se chevauchent jamais."""
+    async with _tracker_tick_lock:
+        subscriptions = await db.rr_all_subscriptions()
+        await rr_scheduler.sync(list({puuid for guild_id, puuid, _ in subscriptions if bot.get_guild(guild_id)}))
+        due = rr_scheduler.pop_due()
+        if not due:
+            return
+        jobs = await rr_poll_jobs(due)
+        for puuid in set(due) - {row["puuid"] for row, _ in jobs}:
+            rr_scheduler.settle(puuid)  # plus suivi ou serveur indisponible
+        await rr_scheduler.run_cycle(jobs)
+
+
+@tasks.loop(seconds=RR_SCHEDULER_TICK)
+async def rr_tracker_loop() -> None:
+    await bot.wait_until_ready()
+    if not HENRIK_API_KEY or valo_api.breaker.is_open():
+        return  # API dégradée : les joueurs dus restent en tête de l'échéancier
+    await run_tracker_tick()
 
 
 @rr_tracker_loop.error
@@ -2130,6 +4622,87 @@ async def rr_tracker_loop_error(exc: Exception) -> None:
         rr_tracker_loop.start()
 
 
+def _backfill_history_rows(job: sqlite3.Row, entries: List[HistoryEntry]) -> List[tuple]:
+    # Les parties jouées après l'ajout reviennent au suivi en direct, qui les annonce.
+    started = datetime.fromisoformat(job["started_at"]).replace(tzinfo=timezone.utc)
+    return [
+        (job["puuid"], entry.match_id, int(entry.rr_change), entry.rr,
+         entry.tier_name, entry.map_name, entry.played_at.isoformat())
+        for entry in entries
+        if entry.match_id and entry.rr_change is not None
+        and entry.played_at is not None and entry.played_at <= started
+    ]
+
+
+def _backfill_detail_rows(puuid: str, records: List[MatchRecord]) -> List[tuple]:
+    rows = []
+    for record in records:
+        if not record.match_id:
+            continue
+        details = _find_match_details({record.match_id: record}, record.match_id, puuid)
+        rows.append((
+            details.get("map_name"), details.get("agent_name"), details.get("kills"),
+            details.get("deaths"), details.get("assists"), details.get("rounds_won"),
+            details.get("rounds_lost"), puuid, record.match_id,
+        ))
+    return rows
+
+
+async def backfill_account(job: sqlite3.Row) -> None:
+    """Reprend l'historique classé d'un compte, page par page.
+
+    Étape « history » : stored-mmr-history (RR gagnés/perdus), puis « matches » :
+    stored-matches (agent, KDA, score). Chaque page est écrite avec l'avancée du
+    curseur dans une seule transaction, ce qui permet de reprendre après un redémarrage.
+    """
+    puuid = job["puuid"]
+    region = job["region"] or RR_DEFAULT_REGION
+    platform = job["platform"] or RR_DEFAULT_PLATFORM
+    stage, page = job["stage"], job["page"]
+    while stage != "done":
+        if valo_api.breaker.is_open():
+            return
+        try:
+            if stage == "history":
+                raw = await valo_api.get_stored_mmr_history(region, puuid, platform, page=page)
+            else:
+                raw = await valo_api.get_stored_matches(region, puuid, page=page)
+        except ValorantAPITransientError as exc:
+            print(f"[RR] Reprise d'historique en pause pour {job['riot_name']} : {exc}")
+            return
+        except ValorantAPIError as exc:
+            # Erreur définitive (404, compte privé…) : l'étape est close, le curseur avance.
+            print(f"[RR] Reprise d'historique ({stage}) impossible pour {job['riot_name']} : {exc}")
+            raw = []
+
+        last_page = len(raw) < RR_BACKFILL_PAGE_SIZE or page >= RR_BACKFILL_MAX_PAGES
+        if stage == "history":
+            stage, page = ("matches", 1) if last_page else ("history", page + 1)
+            await db.rr_backfill_history(puuid, _backfill_history_rows(job, parse_history(raw)), stage, page)
+        else:
+            stage, page = ("done", page) if last_page else ("matches", page + 1)
+            await db.rr_backfill_details(puuid, _backfill_detail_rows(puuid, parse_matches(raw)), stage, page)
+    print(f"[RR] Historique repris pour {job['riot_name']}.")
+
+
+@tasks.loop(minutes=1)
+async def rr_backfill_loop() -> None:
+    await bot.wait_until_ready()
+    if not HENRIK_API_KEY or valo_api.breaker.is_open():
+        return
+    for job in await db.rr_backfill_pending():
+        if job["guild_id"] is not None:
+            await backfill_account(job)
+
+
+@rr_backfill_loop.error
+async def rr_backfill_loop_error(exc: Exception) -> None:
+    print(f"[RR] La reprise d'historique a planté : {exc}")
+    await asyncio.sleep(60)
+    if not rr_backfill_loop.is_running():
+        rr_backfill_loop.start()
+
+
 @tasks.loop(minutes=10)
 async def rr_daily_recap_loop() -> None:
     await bot.wait_until_ready()
@@ -2137,12 +4710,12 @@ async def rr_daily_recap_loop() -> None:
     if now.hour != RR_DAILY_RECAP_HOUR or now.minute >= 10:
         return
     for guild in bot.guilds:
-        if not db.rr_list_players(guild.id):
+        if not await db.rr_list_players(guild.id):
             continue
         channel = get_rr_channel(guild)
         if channel is None:
             continue
-        stats = db.rr_daily_stats(guild.id, _start_of_today_utc_iso())
+        stats = await db.rr_daily_stats(guild.id, _start_of_today_utc_iso())
         if not stats:
             continue
         try:
@@ -2340,7 +4913,7 @@ class PPStartModal(discord.ui.Modal, title="Lancer une partie perso"):
                 ephemeral=True,
             )
 
-        if load_match_state(prep_channel.id) is not None:
+        if await load_match_state(prep_channel.id) is not None:
             return await interaction.response.send_message(
                 f"Une partie est déjà active dans **{prep_channel.name}**. Termine-la ou utilise `/pp_cleanup`.",
                 ephemeral=True,
@@ -2360,15 +4933,17 @@ class PPStartModal(discord.ui.Modal, title="Lancer une partie perso"):
             map_voters={},
         )
 
-        ui_message = await prep_channel.send(embeds=build_match_embeds(interaction.guild, state), view=PPMatchView())
+        embeds = build_match_embeds(interaction.guild, state)
+        ui_message = await prep_channel.send(embeds=embeds, view=PPMatchView())
         state.ui_message_id = ui_message.id
-        persist_match_state(state)
+        match_panels.remember(state, embeds)
+        await persist_match_state(state)
 
         count = len(ordered_prep_members(prep_channel))
         await interaction.response.send_message(
             (
                 f"✅ Partie créée dans le chat de **{prep_channel.name}**.\n"
-                f"Map + vote dispo tout de suite. Équipes auto seulement à **10 joueurs** minimum.\n"
+                f"Map + vote dispo tout de suite. Équipes auto seulement à **{PP_MIN_PLAYERS} joueurs** minimum.\n"
                 f"Joueurs actuellement détectés : **{count}**."
             ),
             ephemeral=True,
@@ -2385,7 +4960,7 @@ class PPMatchView(discord.ui.View):
             await interaction.response.send_message("Ce panneau doit être utilisé dans le chat d'un vocal Préparation.", ephemeral=True)
             return None, None
 
-        state = load_match_state(channel.id)
+        state = await load_match_state(channel.id)
         if state is None:
             await interaction.response.send_message("Aucune partie active pour ce vocal.", ephemeral=True)
             return None, None
@@ -2414,8 +4989,8 @@ class PPMatchView(discord.ui.View):
         state.map_yes += 1
         if state.map_yes >= VOTE_THRESHOLD_ACCEPT:
             state.map_locked = True
-        persist_match_state(state)
-        await interaction.response.edit_message(embeds=build_match_embeds(interaction.guild, state), view=self)
+        await persist_match_state(state)
+        await interaction.response.edit_message(embeds=match_panels.render(interaction.guild, state), view=self)
 
     @discord.ui.button(label="❌ Non", style=discord.ButtonStyle.danger, custom_id="pp:match:no", row=0)
     async def vote_no(self, interaction: discord.Interaction, _: discord.ui.Button) -> None:
@@ -2443,8 +5018,8 @@ class PPMatchView(discord.ui.View):
             state.map_voters = {}
             note = "❌ 5 votes non atteints : nouvelle map proposée."
 
-        persist_match_state(state)
-        await interaction.response.edit_message(embeds=build_match_embeds(interaction.guild, state), view=self)
+        await persist_match_state(state)
+        await interaction.response.edit_message(embeds=match_panels.render(interaction.guild, state), view=self)
         if note:
             await interaction.followup.send(note, ephemeral=True)
 
@@ -2463,8 +5038,8 @@ class PPMatchView(discord.ui.View):
         state.map_no = 0
         state.map_locked = False
         state.map_voters = {}
-        persist_match_state(state)
-        await interaction.response.edit_message(embeds=build_match_embeds(interaction.guild, state), view=self)
+        await persist_match_state(state)
+        await interaction.response.edit_message(embeds=match_panels.render(interaction.guild, state), view=self)
 
     @discord.ui.button(label="🚀 Lancer la PP", style=discord.ButtonStyle.primary, custom_id="pp:match:launch", row=1)
     async def launch(self, interaction: discord.Interaction, _: discord.ui.Button) -> None:
@@ -2479,27 +5054,30 @@ class PPMatchView(discord.ui.View):
             return await interaction.response.send_message("La PP est déjà lancée pour ce vocal.", ephemeral=True)
 
         current_members = ordered_prep_members(prep_channel)
-        if len(current_members) < 10:
-            await interaction.response.edit_message(embeds=build_match_embeds(interaction.guild, state), view=self)
+        if len(current_members) < PP_MIN_PLAYERS:
+            await interaction.response.edit_message(embeds=match_panels.render(interaction.guild, state), view=self)
             return await interaction.followup.send(
-                f"Il faut **10 joueurs** pour lancer la PP. Actuellement : **{len(current_members)}/10**.",
+                f"Il faut **{PP_MIN_PLAYERS} joueurs** pour lancer la PP. "
+                f"Actuellement : **{len(current_members)}/{PP_MIN_PLAYERS}**.",
                 ephemeral=True,
             )
 
-        selected_members = current_members[:10]
-        waiting_members = current_members[10:]
-        attack, defense = split_balanced_teams(selected_members)
+        selected_members = current_members[:PP_MAX_PLAYERS]
+        waiting_members = current_members[PP_MAX_PLAYERS:]
+        stored_ranks = await fetch_stored_ranks(selected_members)
+        # Au-delà de BALANCE_TABLE_MAX, la recherche peut durer BALANCE_TIME_BUDGET : hors de la boucle.
+        attack, defense = await asyncio.to_thread(split_balanced_teams, selected_members, stored_ranks)
         await apply_team_roles(interaction.guild, attack, defense)
         await move_teams_if_possible(prep_channel, attack, defense)
 
         state.attack_ids = [member.id for member in attack]
         state.defense_ids = [member.id for member in defense]
-        persist_match_state(state)
-        await interaction.response.edit_message(embeds=build_match_embeds(interaction.guild, state), view=self)
+        await persist_match_state(state)
+        await interaction.response.edit_message(embeds=match_panels.render(interaction.guild, state), view=self)
 
         if waiting_members:
             await interaction.followup.send(
-                "✅ PP lancée avec les **10 premiers arrivés**. Hors top 10 : " + ", ".join(member.display_name for member in waiting_members),
+                f"✅ PP lancée avec les **{PP_MAX_PLAYERS} premiers arrivés**. Hors top {PP_MAX_PLAYERS} : " + ", ".join(member.display_name for member in waiting_members),
                 ephemeral=True,
             )
 
@@ -2513,7 +5091,7 @@ class PPMatchView(discord.ui.View):
         if not is_match_controller(interaction.user, state):
             return await interaction.response.send_message("Réservé au créateur de la partie, Orga PP ou admin.", ephemeral=True)
 
-        db.delete_active_match(prep_channel.id)
+        await db.delete_active_match(prep_channel.id)
         members = [m for m in interaction.guild.members if m.id in state.attack_ids + state.defense_ids]
         await clear_team_roles(interaction.guild, members)
         await interaction.response.edit_message(content="❌ Partie annulée.", embed=None, view=None)
@@ -2622,7 +5200,7 @@ class CustomVoiceControlView(discord.ui.View):
         channel = await self._resolve(interaction)
         if channel is None:
             return
-        owner_id = db.get_custom_voice_owner(channel.id)
+        owner_id = custom_voices.owner(channel.id)
         owner = interaction.guild.get_member(owner_id) if owner_id else interaction.user
         await set_custom_voice_permissions(channel, owner=owner, locked=True)
         await refresh_custom_voice_panel(channel)
@@ -2633,7 +5211,7 @@ class CustomVoiceControlView(discord.ui.View):
         channel = await self._resolve(interaction)
         if channel is None:
             return
-        owner_id = db.get_custom_voice_owner(channel.id)
+        owner_id = custom_voices.owner(channel.id)
         owner = interaction.guild.get_member(owner_id) if owner_id else interaction.user
         await set_custom_voice_permissions(channel, owner=owner, locked=False)
         await refresh_custom_voice_panel(channel)
@@ -2678,6 +5256,8 @@ class PPBot(commands.Bot):
         self.add_view(TicketPanelView())
         self.add_view(TicketActiveView())
         self.add_view(TicketStaffView())
+        await custom_voices.load()
+        await panels.load()
         if GUILD_ID:
             guild = discord.Object(id=int(GUILD_ID))
             self.tree.copy_global_to(guild=guild)
@@ -2693,6 +5273,10 @@ bot = PPBot()
 @bot.event
 async def on_ready() -> None:
     await seed_existing_prep_members(bot.guilds)
+
+    removed = await custom_voices.reconcile(bot)
+    if removed:
+        print(f"[VOC] {removed} voc(s) privée(s) orpheline(s) supprimée(s) de la base.")
     
     # Cache invitations pour le tracker
     for guild in bot.guilds:
@@ -2713,13 +5297,53 @@ async def on_ready() -> None:
             rr_tracker_loop.start()
         if not rr_daily_recap_loop.is_running():
             rr_daily_recap_loop.start()
-        print(f"[RR] Tracker actif — vérification toutes les {RR_POLL_INTERVAL}s.")
+        if not rr_backfill_loop.is_running():
+            rr_backfill_loop.start()
+        print(f"[RR] Tracker actif — vérification toutes les {RR_POLL_INTERVAL}s à {RR_POLL_MAX_INTERVAL}s selon l'activité.")
     else:
         print("[RR] HENRIK_API_KEY manquante : le tracker RR est désactivé.")
 
     print(f"[OK] Connecté en tant que {bot.user} ({bot.user.id})")
 
 
+@bot.event
+async def on_guild_channel_create(channel: discord.abc.GuildChannel) -> None:
+    channel_index.invalidate(channel.guild.id)
+
+
+@bot.event
+async def on_guild_channel_update(before: discord.abc.GuildChannel, after: discord.abc.GuildChannel) -> None:
+    channel_index.invalidate(after.guild.id)
+
+
+@bot.event
+async def on_guild_channel_delete(channel: discord.abc.GuildChannel) -> None:
+    channel_index.invalidate(channel.guild.id)
+    await custom_voices.remove(channel.id)
+    await panels.forget_channel(channel.id)
+
+
+@bot.event
+async def on_guild_role_create(role: discord.Role) -> None:
+    role_registry.refresh(role.guild)
+
+
+@bot.event
+async def on_guild_role_update(before: discord.Role, after: discord.Role) -> None:
+    role_registry.refresh(after.guild)
+
+
+@bot.event
+async def on_guild_role_delete(role: discord.Role) -> None:
+    role_registry.refresh(role.guild)
+
+
+@bot.event
+async def on_guild_remove(guild: discord.Guild) -> None:
+    role_registry.forget(guild.id)
+    channel_index.invalidate(guild.id)
+
+
 @bot.event
 async def on_invite_create(invite: discord.Invite) -> None:
     try:
@@ -2796,8 +5420,7 @@ async def on_voice_state_update(member: discord.Member, before: discord.VoiceSta
     if isinstance(before.channel, discord.VoiceChannel):
         if is_prep_voice(before.channel) and (not after.channel or after.channel.id != before.channel.id):
             forget_member_from_prep(before.channel, member)
-            if load_match_state(before.channel.id) is not None:
-                await refresh_match_message(member.guild, before.channel.id)
+            refresh_match_message(member.guild, before.channel.id)
         if is_custom_voice(before.channel) and (not after.channel or after.channel.id != before.channel.id):
             await refresh_custom_voice_panel(before.channel)
         if not after.channel or after.channel.id != before.channel.id:
@@ -2821,8 +5444,7 @@ async def on_voice_state_update(member: discord.Member, before: discord.VoiceSta
 
         if is_prep_voice(after.channel) and (not before.channel or before.channel.id != after.channel.id):
             remember_member_in_prep(after.channel, member)
-            if load_match_state(after.channel.id) is not None:
-                await refresh_match_message(member.guild, after.channel.id)
+            refresh_match_message(member.guild, after.channel.id)
         if is_custom_voice(after.channel) and (not before.channel or before.channel.id != after.channel.id):
             await ensure_custom_voice_panel(after.channel)
             await refresh_custom_voice_panel(after.channel)
@@ -2850,42 +5472,33 @@ async def setup_pp(interaction: discord.Interaction) -> None:
         missing.append(f"#{RANK_CHANNEL_NAME} (ou alias pour le rank)")
         
     for name in PREP_CHANNEL_NAMES:
-        found = discord.utils.find(
-            lambda c: isinstance(c, discord.VoiceChannel) and slug(c.name) == slug(name),
-            guild.channels,
-        )
+        found = find_prep_voice(guild, name)
         if found is None:
             missing.append(name)
 
     # Déploiement du message Captcha
     if verify_channel is not None:
-        should_post = True
-        async for msg in verify_channel.history(limit=20):
-            if msg.author == guild.me and msg.components:
-                should_post = False
-                break
-        if should_post:
+        async def captcha_panel() -> Tuple[discord.Embed, discord.ui.View]:
             embed = discord.Embed(
                 title="🛡️ Vérification de sécurité",
                 description="Bienvenue à Asakusa ! Avant de pouvoir entrer et discuter, prouve que tu n'es pas un robot en cliquant sur le bouton ci-dessous.",
                 color=discord.Color.green(),
             )
-            await verify_channel.send(embed=embed, view=CaptchaView(guild))
+            return embed, CaptchaView(guild)
+
+        await panels.ensure(verify_channel, "captcha", captcha_panel)
 
     # Déploiement du message de choix de Rank
     if rank_channel is not None:
-        should_post = True
-        async for msg in rank_channel.history(limit=20):
-            if msg.author == guild.me and msg.components:
-                should_post = False
-                break
-        if should_post:
+        async def rank_panel() -> Tuple[discord.Embed, discord.ui.View]:
             embed = discord.Embed(
                 title="🎭 Choix du Rank Valorant",
                 description="Choisis ton **Peak Elo Valorant des 5 derniers actes** pour mettre à jour ton profil.\nLe salon est en **lecture seule** : tout se fait via le menu.",
                 color=discord.Color.blurple(),
             )
-            await rank_channel.send(embed=embed, view=VerificationView(guild))
+            return embed, VerificationView(guild)
+
+        await panels.ensure(rank_channel, "rank", rank_panel)
 
 
     # === CRÉATION ET CONFIGURATION DES TICKETS ===
@@ -2921,13 +5534,7 @@ async def setup_pp(interaction: discord.Interaction) -> None:
             view_channel=True, send_messages=True, add_reactions=True, read_message_history=True, manage_messages=True
         )
 
-    should_post_ticket = True
-    async for msg in ticket_channel.history(limit=20):
-        if msg.author == guild.me and msg.components:
-            should_post_ticket = False
-            break
-
-    if should_post_ticket:
+    async def ticket_panel() -> Tuple[discord.Embed, discord.ui.View]:
         embed = discord.Embed(
             title="🎟️ Assistance & Requêtes",
             description=(
@@ -2940,7 +5547,9 @@ async def setup_pp(interaction: discord.Interaction) -> None:
             ),
             color=discord.Color.red()
         )
-        await ticket_channel.send(embed=embed, view=TicketPanelView())
+        return embed, TicketPanelView()
+
+    await panels.ensure(ticket_channel, "ticket", ticket_panel)
 
     # === CRÉATION DU SALON DE SUIVI RR ===
     rr_channel = await ensure_rr_channel(guild)
@@ -2970,7 +5579,7 @@ async def pp(interaction: discord.Interaction) -> None:
             "Tu dois être connecté dans **Préparation 1, 2, 3 ou 4** pour lancer `/pp`.",
             ephemeral=True,
         )
-    if load_match_state(prep_channel.id) is not None:
+    if await load_match_state(prep_channel.id) is not None:
         return await interaction.response.send_message(
             f"Une partie est déjà active dans **{prep_channel.name}**. Termine-la avec les boutons du panneau ou `/pp_cleanup`.",
             ephemeral=True,
@@ -2990,7 +5599,7 @@ async def pp_cleanup(interaction: discord.Interaction) -> None:
     if not is_prep_voice(prep_channel):
         return await interaction.response.send_message("Connecte-toi dans un vocal Préparation.", ephemeral=True)
 
-    state = load_match_state(prep_channel.id)
+    state = await load_match_state(prep_channel.id)
     if state is None:
         return await interaction.response.send_message("Aucune partie active dans ce vocal.", ephemeral=True)
     if not is_match_controller(interaction.user, state):
@@ -2998,7 +5607,7 @@ async def pp_cleanup(interaction: discord.Interaction) -> None:
 
     members = [m for m in interaction.guild.members if m.id in state.attack_ids + state.defense_ids]
     await clear_team_roles(interaction.guild, members)
-    db.delete_active_match(prep_channel.id)
+    await db.delete_active_match(prep_channel.id)
     await interaction.response.send_message("✅ Partie active nettoyée.", ephemeral=True)
 
 
@@ -3095,10 +5704,15 @@ async def rr_add(interaction: discord.Interaction, riot_id: str,
         real_name = (mmr.get("account") or {}).get("name") or account.get("name") or name
         real_tag = (mmr.get("account") or {}).get("tag") or account.get("tag") or tag
 
-        db.rr_add_player(puuid, interaction.guild.id, cible.id, real_name, real_tag,
-                         detected_region, platform, interaction.user.id)
-        db.rr_update_state(puuid, tier_id, tier_name, rr, elo, None)
-        db.rr_update_peak(puuid, peak_tier_id, peak_tier_name)
+        uow = db.unit_of_work()
+        uow.rr_add_player(puuid, interaction.guild.id, cible.id, real_name, real_tag,
+                          detected_region, platform, interaction.user.id)
+        uow.rr_update_state(puuid, tier_id, tier_name, rr, elo, None)
+        uow.rr_update_peak(puuid, peak_tier_id, peak_tier_name)
+        await uow.commit()
+        # rr_update_state réécrit le sort_key sur tous les serveurs qui suivent déjà ce compte.
+        for guild_id in await db.rr_subscribed_guilds(puuid):
+            leaderboard_pages.invalidate(guild_id)
 
         applied = None
         if RR_AUTO_SYNC_ROLES:
@@ -3144,7 +5758,7 @@ async def rr_remove(interaction: discord.Interaction, riot_id: str) -> None:
             "Format invalide. Utilise `Pseudo#TAG`.", ephemeral=True
         )
     name, tag = parsed
-    row = db.rr_find_player(interaction.guild.id, name, tag)
+    row = await db.rr_find_player(interaction.guild.id, name, tag)
     if row is None:
         return await interaction.response.send_message(
             f"❌ **{name}#{tag}** n'est pas dans la liste de suivi.", ephemeral=True
@@ -3156,17 +5770,21 @@ async def rr_remove(interaction: discord.Interaction, riot_id: str) -> None:
             "Seuls les orgas et les admins peuvent retirer le compte d'un autre membre.", ephemeral=True
         )
 
-    db.rr_remove_player(row["puuid"])
+    guild_ids = await db.rr_subscribed_guilds(row["puuid"])
+    supprime = await db.rr_unsubscribe(interaction.guild.id, row["puuid"])
+    for guild_id in guild_ids:
+        leaderboard_pages.invalidate(guild_id)
+    detail = "son historique a été supprimé" if supprime else "il reste suivi sur un autre serveur"
     await interaction.response.send_message(
         f"🗑️ **{row['riot_name']}#{row['riot_tag']}** a été retiré du suivi RR "
-        f"(son historique a été supprimé).", ephemeral=True
+        f"({detail}).", ephemeral=True
     )
 
 
 @bot.tree.command(name="rr_list", description="Affiche la liste des joueurs suivis par le tracker RR.")
 @app_commands.guild_only()
 async def rr_list(interaction: discord.Interaction) -> None:
-    players = db.rr_list_players(interaction.guild.id)
+    players = await db.rr_list_players(interaction.guild.id)
     if not players:
         return await interaction.response.send_message(
             "Aucun joueur suivi pour l'instant. Ajoute-toi avec `/rr_add Pseudo#TAG`.", ephemeral=True
@@ -3191,22 +5809,19 @@ async def rr_list(interaction: discord.Interaction) -> None:
 @bot.tree.command(name="leaderboard", description="Classement des joueurs suivis par RR.")
 @app_commands.guild_only()
 async def leaderboard(interaction: discord.Interaction) -> None:
-    rows = db.rr_leaderboard(interaction.guild.id)
-    if not rows:
+    if not await db.rr_count_players(interaction.guild.id):
         return await interaction.response.send_message(
             "Aucun joueur suivi pour l'instant. Ajoute-toi avec `/rr_add Pseudo#TAG`.", ephemeral=True
         )
-    pages = max(1, math.ceil(len(rows) / RR_PAGE_SIZE))
-    view = LeaderboardView(interaction.guild, rows) if pages > 1 else None
-    await interaction.response.send_message(
-        embed=build_leaderboard_embed(interaction.guild, rows, 0, pages), view=view
-    )
+    embed, pages = await leaderboard_pages.get(interaction.guild, 0)
+    view = LeaderboardView(interaction.guild, pages) if pages > 1 else None
+    await interaction.response.send_message(embed=embed, view=view)
 
 
 @bot.tree.command(name="daily", description="Classement journalier des RR gagnés et perdus.")
 @app_commands.guild_only()
 async def daily(interaction: discord.Interaction) -> None:
-    stats = db.rr_daily_stats(interaction.guild.id, _start_of_today_utc_iso())
+    stats = await db.rr_daily_stats(interaction.guild.id, _start_of_today_utc_iso())
     embed = build_daily_embed(interaction.guild, stats, _paris_now().strftime("%d/%m/%Y"))
     await interaction.response.send_message(embed=embed)
 
@@ -3224,19 +5839,19 @@ async def rr_stats(interaction: discord.Interaction, riot_id: Optional[str] = No
         parsed = _parse_riot_id(riot_id)
         if parsed is None:
             return await interaction.response.send_message("Format invalide : `Pseudo#TAG`.", ephemeral=True)
-        row = db.rr_find_player(interaction.guild.id, *parsed)
+        row = await db.rr_find_player(interaction.guild.id, *parsed)
     else:
         cible = membre or interaction.user
-        row = db.rr_find_by_discord(interaction.guild.id, cible.id)
+        row = await db.rr_find_by_discord(interaction.guild.id, cible.id)
 
     if row is None:
         return await interaction.response.send_message(
             "❌ Ce joueur n'est pas suivi. Ajoute-le avec `/rr_add Pseudo#TAG`.", ephemeral=True
         )
 
-    jour = db.rr_period_stats(interaction.guild.id, row["puuid"], _start_of_today_utc_iso())
+    jour = await db.rr_period_stats(interaction.guild.id, row["puuid"], _start_of_today_utc_iso())
     semaine_iso = (_paris_now() - timedelta(days=7)).astimezone(timezone.utc).isoformat()
-    semaine = db.rr_period_stats(interaction.guild.id, row["puuid"], semaine_iso)
+    semaine = await db.rr_period_stats(interaction.guild.id, row["puuid"], semaine_iso)
 
     embed = discord.Embed(
         title=f"📊 {row['riot_name']}#{row['riot_tag']}",
@@ -3257,8 +5872,14 @@ async def rr_stats(interaction: discord.Interaction, riot_id: Optional[str] = No
 
     embed.add_field(name="Aujourd'hui", value=_bloc(jour), inline=True)
     embed.add_field(name="7 derniers jours", value=_bloc(semaine), inline=True)
+    place, classes = await leaderboard_pages.position(interaction.guild.id, row)
+    embed.add_field(
+        name="Classement",
+        value=f"{MEDALS.get(place, '')} **{place}{'er' if place == 1 else 'ème'}** sur {classes}".strip(),
+        inline=True,
+    )
 
-    historique = db.rr_player_history(row["puuid"], limit=5)
+    historique = await db.rr_player_history(row["puuid"], limit=5)
     if historique:
         lignes = []
         for h in historique:
@@ -3282,7 +5903,8 @@ async def rr_help(interaction: discord.Interaction) -> None:
         description=(
             f"Le bot surveille les parties classées des joueurs enregistrés et publie "
             f"automatiquement le résultat dans {salon} (RR gagnés/perdus, score, agent, map).\n"
-            f"Vérification toutes les **{RR_POLL_INTERVAL // 60} minutes** environ."
+            f"Vérification toutes les **{RR_POLL_INTERVAL // 60} minutes** environ pour les joueurs actifs, "
+            f"moins souvent pour les comptes inactifs."
         ),
         color=discord.Color(0xFF69B4),
     )
@@ -3351,25 +5973,25 @@ async def rr_refresh(interaction: discord.Interaction) -> None:
             "❌ `HENRIK_API_KEY` absente du `.env` : le suivi est désactivé.", ephemeral=True
         )
 
-    await interaction.response.defer(ephemeral=True, thinking=True)
-    players = db.rr_list_players(interaction.guild.id)
+    players = await db.rr_list_players(interaction.guild.id)
     if not players:
-        return await interaction.followup.send("Aucun joueur suivi.", ephemeral=True)
-
-    channel = get_rr_channel(interaction.guild) or await ensure_rr_channel(interaction.guild)
-    erreurs = 0
-    for row in players:
-        try:
-            await process_player(interaction.guild, row, channel)
-        except Exception as exc:
-            erreurs += 1
-            print(f"[RR] refresh — erreur sur {row['riot_name']} : {exc}")
-        await asyncio.sleep(1)
-
-    texte = f"✅ Vérification terminée pour {len(players)} joueur(s)."
-    if erreurs:
-        texte += f"\n⚠️ {erreurs} compte(s) en erreur (voir les logs)."
-    await interaction.followup.send(texte, ephemeral=True)
+        return await interaction.response.send_message("Aucun joueur suivi.", ephemeral=True)
+
+    # Les comptes passent en tête de l'échéancier (déjà demandés ou en cours : pas de doublon) ;
+    # les nouvelles parties sont annoncées comme d'habitude, y compris sur les autres serveurs abonnés.
+    puuids = [row["puuid"] for row in players]
+    progress = RefreshProgress(interaction, set(puuids))
+    rr_scheduler.watch(progress)
+    rr_scheduler.enqueue_front(puuids)
+    await interaction.response.send_message(progress.text(), ephemeral=True)
+    if valo_api.breaker.is_open():
+        await interaction.followup.send(
+            f"⚠️ API Valorant indisponible : reprise dans {valo_api.breaker.retry_in():.0f}s.", ephemeral=True
+        )
+        return
+    task = asyncio.create_task(run_tracker_tick())
+    _refresh_tasks.add(task)
+    task.add_done_callback(_refresh_tasks.discard)
 
 
 # ===================== RENDER WEB HEALTH SERVER =====================
@@ -3377,6 +5999,16 @@ WEB_HOST = os.getenv("WEB_HOST", "0.0.0.0")
 WEB_PORT = int(os.getenv("PORT", os.getenv("WEB_PORT", "10000")))
 
 
+def collect_metrics() -> Dict[str, dict]:
+    metrics: Dict[str, dict] = {}
+    for name, provider in list(METRICS_PROVIDERS.items()):
+        try:
+            metrics[name] = provider()
+        except Exception as exc:
+            metrics[name] = {"error": str(exc)}
+    return metrics
+
+
 class _HealthHandler(BaseHTTPRequestHandler):
     def do_GET(self):
         if self.path in ("/", "/health", "/healthz"):
@@ -3386,6 +6018,13 @@ class _HealthHandler(BaseHTTPRequestHandler):
             self.send_header("Content-Length", str(len(body)))
             self.end_headers()
             self.wfile.write(body)
+        elif self.path == "/metrics":
+            body = json.dumps(collect_metrics(), default=str).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
         else:
             body = b"not found"
             self.send_response(404)
@@ -3418,6 +6057,7 @@ def main() -> None:
             asyncio.run(valo_api.close())
         except Exception:
             pass
+        db.close()
 
 
 if __name__ == "__main__":